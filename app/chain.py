@@ -1,13 +1,24 @@
 from __future__ import annotations
 
 import asyncio
+import math
 import os
 import re
 import time
 from dataclasses import dataclass
-from typing import Any
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Awaitable, Callable
 
 import httpx
+import orjson
+
+from app.fileio import write_bytes_atomic
+from app.lru import LRUCache
+
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+TOKEN_META_PATH = DATA_DIR / "token_meta.json"
 
 
 @dataclass(frozen=True)
@@ -24,6 +35,8 @@ class _CacheEntry:
     ts: float
     ttl: float
     value: object
+    # Extra window past ttl during which the value is still served while a refresh runs in the background.
+    stale_ttl: float = 0.0
 
 
 @dataclass(frozen=True)
@@ -34,34 +47,54 @@ class TokenMeta:
     error: str | None = None
 
 
+_EVM_ADDRESS_RE = re.compile(r"0x[a-fA-F0-9]{40}")
+_SOLANA_PUBKEY_RE = re.compile(r"[1-9A-HJ-NP-Za-km-z]{32,44}")
+
+
+# Validators/normalizers below are pure and see the same few addresses on every refresh tick.
+@lru_cache(maxsize=4096)
 def _is_evm_address(addr: str) -> bool:
-    return bool(re.fullmatch(r"0x[a-fA-F0-9]{40}", (addr or "").strip()))
+    return bool(_EVM_ADDRESS_RE.fullmatch((addr or "").strip()))
 
 
 _B58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
 _B58_INDEX = {c: i for i, c in enumerate(_B58_ALPHABET)}
 
 
-def _b58decode(s: str) -> bytes:
-    s = (s or "").strip()
+def _b58_int(s: str) -> tuple[int, int]:
+    # Inputs here are bounded (<= 44 chars, ~256 bits), so the bigint accumulator stays a few limbs wide;
+    # measured faster in CPython than a base-256 bytearray carry loop.
     n = 0
     for ch in s:
         n = n * 58 + _B58_INDEX[ch]
     pad = len(s) - len(s.lstrip("1"))
+    return n, pad
+
+
+def _b58decode(s: str) -> bytes:
+    n, pad = _b58_int((s or "").strip())
     b = n.to_bytes((n.bit_length() + 7) // 8, "big") if n else b""
     return (b"\x00" * pad) + b
 
 
+def _b58_decoded_len(s: str) -> int:
+    """Length of _b58decode(s) without materializing the bytes."""
+    n, pad = _b58_int(s)
+    return pad + (n.bit_length() + 7) // 8
+
+
+@lru_cache(maxsize=4096)
 def _is_solana_pubkey(addr: str) -> bool:
     a = (addr or "").strip()
-    if not re.fullmatch(r"[1-9A-HJ-NP-Za-km-z]{32,44}", a):
+    if not _SOLANA_PUBKEY_RE.fullmatch(a):
         return False
     try:
-        return len(_b58decode(a)) == 32
+        return _b58_decoded_len(a) == 32
     except Exception:
         return False
 
 
+@lru_cache(maxsize=256)
 def _rpc_env_key(chain: str) -> str:
     return f"PP_RPC_{chain.strip().upper()}"
 
@@ -70,6 +103,7 @@ def _get_rpc_url(chain: str) -> str | None:
     return os.environ.get(_rpc_env_key(chain))
 
 
+@lru_cache(maxsize=256)
 def _is_solana_chain(chain: str) -> bool:
     c = (chain or "").strip().lower()
     return c in {"sol", "solana"}
@@ -81,15 +115,42 @@ def _get_solana_rpc_url(chain: str) -> str:
     return (rpc or "https://api.mainnet-beta.solana.com").strip()
 
 
+# ERC-20 function selectors.
+_SEL_DECIMALS = "0x313ce567"
+_SEL_SYMBOL = "0x95d89b41"
+_SEL_BALANCE_OF = "0x70a08231"
+
+
 def _pad_address(addr: str) -> str:
     a = addr.lower().replace("0x", "")
     return a.rjust(64, "0")
 
 
+@lru_cache(maxsize=1024)
+def _balanceof_calldata(wallet: str) -> str:
+    # Same wallet is queried against every token in a refresh; build its calldata once.
+    return _SEL_BALANCE_OF + _pad_address(wallet)
+
+
+def _token_meta_calls(token_address: str) -> list[tuple[str, list[Any]]]:
+    return [
+        ("eth_call", [{"to": token_address, "data": _SEL_DECIMALS}, "latest"]),
+        ("eth_call", [{"to": token_address, "data": _SEL_SYMBOL}, "latest"]),
+    ]
+
+
 def _hex_to_int(hex_str: str) -> int:
     return int(hex_str, 16)
 
 
+_ABI_STRING_HEAD = (32).to_bytes(32, "big")
+
+
+def _clean_str(raw: bytes) -> str | None:
+    s = raw.decode("utf-8", errors="ignore").strip("\x00").strip()
+    return s or None
+
+
 def _decode_abi_string(result_hex: str) -> str | None:
     h = (result_hex or "").lower()
     if h.startswith("0x"):
@@ -97,82 +158,181 @@ def _decode_abi_string(result_hex: str) -> str | None:
     if not h:
         return None
     data = bytes.fromhex(h)
-    if len(data) < 32:
+    n = len(data)
+    if n < 32:
         return None
-    # dynamic string: [offset][...][len][bytes...]
-    try:
+    # dynamic string: [offset][...][len][bytes...]; solc always emits offset=32 for a single return value.
+    if data[:32] == _ABI_STRING_HEAD:
+        offset = 32
+    else:
         offset = int.from_bytes(data[0:32], "big")
-        if offset + 32 <= len(data):
-            ln = int.from_bytes(data[offset : offset + 32], "big")
-            start = offset + 32
-            end = start + ln
-            if end <= len(data):
-                s = data[start:end].decode("utf-8", errors="ignore").strip("\x00").strip()
-                return s or None
-    except Exception:
-        pass
+    if offset + 32 <= n:
+        start = offset + 32
+        end = start + int.from_bytes(data[offset:start], "big")
+        if end <= n:
+            return _clean_str(data[start:end])
 
     # bytes32 symbol: right-padded
-    try:
-        s = data[0:32].decode("utf-8", errors="ignore").strip("\x00").strip()
-        return s or None
-    except Exception:
-        return None
+    return _clean_str(data[0:32])
 
 
 class ChainProvider:
     def __init__(self) -> None:
+        # Enforced by the client itself (per request) rather than an asyncio.wait_for wrapper per balance.
+        self.request_timeout_seconds = 8.0
+        # HTTP/2 multiplexes concurrent JSON-RPC calls to the same node over one TLS connection.
         self._client = httpx.AsyncClient(
-            timeout=httpx.Timeout(10.0),
-            limits=httpx.Limits(max_connections=30, max_keepalive_connections=10),
+            http2=True,
+            timeout=httpx.Timeout(self.request_timeout_seconds),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
         )
-        self._lock = asyncio.Lock()
-        self._balance_cache: dict[str, _CacheEntry] = {}
-        self._meta_cache: dict[str, _CacheEntry] = {}
+        # Bounded so a long-running tracker that has seen many addresses does not grow without limit.
+        self._balance_cache: LRUCache[str, _CacheEntry] = LRUCache(4096)
+        self._meta_cache: LRUCache[str, _CacheEntry] = LRUCache(16384)
+        self._inflight: dict[str, asyncio.Task[TokenBalance]] = {}
 
         self.balance_ttl_seconds = 30.0
+        self.balance_stale_ttl_seconds = 5 * 60.0
         self.error_ttl_seconds = 10.0
-        self.meta_ttl_seconds = 24 * 60 * 60.0
-
-        self.max_concurrency = 8
+        # decimals/symbol are effectively immutable per contract: keep successful lookups forever
+        # and persist them so a restart does not refetch meta for every holding.
+        self.meta_ttl_seconds = math.inf
+        self.meta_flush_interval_seconds = 30.0
+        self._meta_dirty = False
+        self._meta_flushed_at = time.monotonic()
+        self._flush_task: asyncio.Task[None] | None = None
+        self._load_meta_from_disk()
+
+        self.max_concurrency = 32
         self._rpc_sem = asyncio.Semaphore(self.max_concurrency)
-        self.request_timeout_seconds = 8.0
+        # Per-endpoint cap on top of the global one, so many holdings on one chain cannot flood
+        # (and get rate-limited by) a single RPC node while other chains sit idle.
+        self.max_concurrency_per_rpc = 8
+        self._rpc_url_sems: dict[str, asyncio.Semaphore] = {}
 
     async def close(self) -> None:
+        if self._flush_task is not None:
+            await self._flush_task
+        self.flush_meta_cache()
         await self._client.aclose()
 
+    def _load_meta_from_disk(self) -> None:
+        try:
+            if not TOKEN_META_PATH.exists():
+                return
+            data = orjson.loads(TOKEN_META_PATH.read_bytes())
+        except Exception:
+            return
+        if not isinstance(data, dict):
+            return
+        now = time.monotonic()
+        for key, it in data.items():
+            if not isinstance(it, dict) or not isinstance(it.get("decimals"), int):
+                continue
+            sym = it.get("symbol")
+            meta = TokenMeta(decimals=it["decimals"], symbol=sym if isinstance(sym, str) else None, source="chain-meta")
+            self._meta_cache[key] = _CacheEntry(ts=now, ttl=self.meta_ttl_seconds, value=meta)
+
+    def _dump_meta(self) -> bytes:
+        out: dict[str, dict[str, Any]] = {}
+        for key, entry in self._meta_cache.items():
+            meta = entry.value
+            if isinstance(meta, TokenMeta) and not meta.error and meta.decimals is not None:
+                out[key] = {"decimals": meta.decimals, "symbol": meta.symbol}
+        return orjson.dumps(out, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS)
+
+    def flush_meta_cache(self) -> None:
+        """Write successful token meta lookups to TOKEN_META_PATH (no-op when nothing changed)."""
+        if not self._meta_dirty:
+            return
+        self._meta_dirty = False
+        self._meta_flushed_at = time.monotonic()
+        _write_token_meta(self._dump_meta())
+
+    def _mark_meta_dirty(self) -> None:
+        # After a successful lookup: flush at most once per interval, with the file write off the event loop.
+        self._meta_dirty = True
+        if self._flush_task is not None and not self._flush_task.done():
+            return
+        if (time.monotonic() - self._meta_flushed_at) < self.meta_flush_interval_seconds:
+            return
+        self._meta_dirty = False
+        self._meta_flushed_at = time.monotonic()
+        self._flush_task = asyncio.create_task(asyncio.to_thread(_write_token_meta, self._dump_meta()))
+
     def _ttl_for_balance(self, bal: TokenBalance) -> float:
         return self.error_ttl_seconds if bal.error else self.balance_ttl_seconds
 
+    def _rpc_url_sem(self, rpc_url: str) -> asyncio.Semaphore:
+        sem = self._rpc_url_sems.get(rpc_url)
+        if sem is None:
+            sem = self._rpc_url_sems[rpc_url] = asyncio.Semaphore(self.max_concurrency_per_rpc)
+        return sem
+
     async def _rpc_limited(self, rpc_url: str, method: str, params: list[Any]) -> Any:
-        async with self._rpc_sem:
+        # Endpoint slot first: calls queued behind a busy node do not hold global slots other chains could use.
+        async with self._rpc_url_sem(rpc_url), self._rpc_sem:
             return await _rpc(self._client, rpc_url, method, params)
 
-    async def _get_token_meta(self, *, rpc_url: str, chain: str, token_address: str) -> TokenMeta:
+    async def _rpc_batch_limited(self, rpc_url: str, calls: list[tuple[str, list[Any]]]) -> list[Any]:
+        async with self._rpc_url_sem(rpc_url), self._rpc_sem:
+            return await _rpc_batch(self._client, rpc_url, calls)
+
+    def _cached_token_meta(self, key: str, now: float) -> TokenMeta | None:
+        # Runs on the event loop with no await between lookup and update, so no lock is needed.
+        cached = self._meta_cache.get(key)
+        if cached and (now - cached.ts) < cached.ttl:
+            return cached.value  # type: ignore[return-value]
+        return None
+
+    async def _get_token_meta(
+        self,
+        *,
+        rpc_url: str,
+        chain: str,
+        token_address: str,
+        prefetched: tuple[Any, Any] | None = None,
+    ) -> TokenMeta:
         key = f"{chain}:{token_address.lower()}"
-        now = time.time()
-        async with self._lock:
-            cached = self._meta_cache.get(key)
-            if cached and (now - cached.ts) < cached.ttl:
-                return cached.value  # type: ignore[return-value]
+        now = time.monotonic()
+        if prefetched is None:
+            cached = self._cached_token_meta(key, now)
+            if cached is not None:
+                return cached
 
         try:
-            data_decimals = "0x313ce567"
-            data_symbol = "0x95d89b41"
-            dec_task = self._rpc_limited(rpc_url, "eth_call", [{"to": token_address, "data": data_decimals}, "latest"])
-            sym_task = self._rpc_limited(rpc_url, "eth_call", [{"to": token_address, "data": data_symbol}, "latest"])
-            raw_dec, raw_sym = await asyncio.gather(dec_task, sym_task)
+            if prefetched is not None:
+                raw_dec, raw_sym = prefetched
+            else:
+                raw_dec, raw_sym = await self._rpc_batch_limited(rpc_url, _token_meta_calls(token_address))
+            for raw in (raw_dec, raw_sym):
+                if isinstance(raw, Exception):
+                    raise raw
             dec = _hex_to_int(raw_dec)
             sym = _decode_abi_string(raw_sym)
             meta = TokenMeta(decimals=dec, symbol=sym, source="chain-meta")
         except Exception as e:
             meta = TokenMeta(decimals=None, symbol=None, source="chain-meta", error=f"{type(e).__name__}: {e}")
 
-        async with self._lock:
-            ttl = self.meta_ttl_seconds if not meta.error else self.error_ttl_seconds
-            self._meta_cache[key] = _CacheEntry(ts=now, ttl=ttl, value=meta)
+        ttl = self.meta_ttl_seconds if not meta.error else self.error_ttl_seconds
+        self._meta_cache[key] = _CacheEntry(ts=now, ttl=ttl, value=meta)
+        if not meta.error:
+            self._mark_meta_dirty()
         return meta
 
+    async def get_many(self, triples: list[tuple[str, str, str | None]]) -> list[TokenBalance | BaseException]:
+        """
+        Fetch balances for (chain, wallet, token_address) triples concurrently.
+        The RPC semaphore provides back-pressure; results are returned in input order,
+        with unexpected exceptions returned in place rather than raised.
+        """
+        return list(
+            await asyncio.gather(
+                *[self.get_evm_token_balance(chain=c, wallet=w, token_address=t) for c, w, t in triples],
+                return_exceptions=True,
+            )
+        )
+
     async def get_evm_token_balance(self, *, chain: str, wallet: str, token_address: str | None) -> TokenBalance:
         chain = (chain or "").strip().lower()
         wallet = (wallet or "").strip()
@@ -189,39 +349,11 @@ class ChainProvider:
                 return TokenBalance(quantity=None, symbol=None, decimals=None, source="solana", error="invalid token mint address")
             rpc_url = _get_solana_rpc_url(chain)
             cache_key = f"solana:{wallet}:{(token_address or 'native')}"
-            now = time.time()
-            async with self._lock:
-                cached = self._balance_cache.get(cache_key)
-                if cached and (now - cached.ts) < cached.ttl:
-                    return cached.value  # type: ignore[return-value]
-
-            bal: TokenBalance
-            try:
-                bal = await asyncio.wait_for(
-                    self._fetch_solana_balance(rpc_url=rpc_url, wallet=wallet, token_mint=token_address),
-                    timeout=self.request_timeout_seconds,
-                )
-            except asyncio.TimeoutError:
-                bal = TokenBalance(
-                    quantity=None,
-                    symbol=None,
-                    decimals=None,
-                    source="solana",
-                    error="TimeoutError: rpc timeout",
-                )
-            except Exception as e:
-                bal = TokenBalance(
-                    quantity=None,
-                    symbol=None,
-                    decimals=None,
-                    source="solana",
-                    error=f"{type(e).__name__}: {e}",
-                )
-
-            ttl = self._ttl_for_balance(bal)
-            async with self._lock:
-                self._balance_cache[cache_key] = _CacheEntry(ts=now, ttl=ttl, value=bal)
-            return bal
+            return await self._get_balance_cached(
+                cache_key,
+                source="solana",
+                fetch=lambda: self._fetch_solana_balance(rpc_url=rpc_url, wallet=wallet, token_mint=token_address),
+            )
 
         # EVM (0x...)
         if not _is_evm_address(wallet):
@@ -240,26 +372,68 @@ class ChainProvider:
             )
 
         cache_key = f"{chain}:{wallet.lower()}:{(token_address or 'native').lower()}"
-        now = time.time()
-        async with self._lock:
-            cached = self._balance_cache.get(cache_key)
-            if cached and (now - cached.ts) < cached.ttl:
-                return cached.value  # type: ignore[return-value]
+        return await self._get_balance_cached(
+            cache_key,
+            source=f"chain:{chain}",
+            fetch=lambda: self._fetch_balance(rpc_url=rpc_url, chain=chain, wallet=wallet, token_address=token_address),
+        )
 
+    async def _get_balance_cached(
+        self,
+        cache_key: str,
+        *,
+        source: str,
+        fetch: Callable[[], Awaitable[TokenBalance]],
+    ) -> TokenBalance:
+        """
+        Serve from cache: fresh entries directly, stale-but-recent entries immediately while one
+        background refresh runs. Concurrent misses for the same key share a single fetch.
+        """
+        now = time.monotonic()
+        cached = self._balance_cache.get(cache_key)
+        if cached:
+            age = now - cached.ts
+            if age < cached.ttl:
+                return cached.value  # type: ignore[return-value]
+            if age < cached.ttl + cached.stale_ttl:
+                self._refresh_balance(cache_key, source=source, fetch=fetch)
+                return cached.value  # type: ignore[return-value]
+        return await asyncio.shield(self._refresh_balance(cache_key, source=source, fetch=fetch))
+
+    def _refresh_balance(
+        self,
+        cache_key: str,
+        *,
+        source: str,
+        fetch: Callable[[], Awaitable[TokenBalance]],
+    ) -> asyncio.Task[TokenBalance]:
+        task = self._inflight.get(cache_key)
+        if task is None:
+            task = asyncio.create_task(self._load_balance(cache_key, source=source, fetch=fetch))
+            self._inflight[cache_key] = task
+            task.add_done_callback(lambda _t: self._inflight.pop(cache_key, None))
+        return task
+
+    async def _load_balance(
+        self,
+        cache_key: str,
+        *,
+        source: str,
+        fetch: Callable[[], Awaitable[TokenBalance]],
+    ) -> TokenBalance:
+        now = time.monotonic()
         bal: TokenBalance
         try:
-            bal = await asyncio.wait_for(
-                self._fetch_balance(rpc_url=rpc_url, chain=chain, wallet=wallet, token_address=token_address),
-                timeout=self.request_timeout_seconds,
-            )
-        except asyncio.TimeoutError:
-            bal = TokenBalance(quantity=None, symbol=None, decimals=None, source=f"chain:{chain}", error="TimeoutError: rpc timeout")
+            bal = await fetch()
+        except TimeoutError:
+            bal = TokenBalance(quantity=None, symbol=None, decimals=None, source=source, error="TimeoutError: rpc timeout")
         except Exception as e:
-            bal = TokenBalance(quantity=None, symbol=None, decimals=None, source=f"chain:{chain}", error=f"{type(e).__name__}: {e}")
+            bal = TokenBalance(quantity=None, symbol=None, decimals=None, source=source, error=f"{type(e).__name__}: {e}")
 
         ttl = self._ttl_for_balance(bal)
-        async with self._lock:
-            self._balance_cache[cache_key] = _CacheEntry(ts=now, ttl=ttl, value=bal)
+        # Never keep serving an error past its ttl.
+        stale_ttl = 0.0 if bal.error else self.balance_stale_ttl_seconds
+        self._balance_cache[cache_key] = _CacheEntry(ts=now, ttl=ttl, value=bal, stale_ttl=stale_ttl)
         return bal
 
     async def _fetch_balance(self, *, rpc_url: str, chain: str, wallet: str, token_address: str | None) -> TokenBalance:
@@ -280,10 +454,25 @@ class ChainProvider:
                     error="invalid token address",
                 )
 
-            meta = await self._get_token_meta(rpc_url=rpc_url, chain=chain, token_address=token_address)
+            balance_call = ("eth_call", [{"to": token_address, "data": _balanceof_calldata(wallet)}, "latest"])
 
-            data_balance = "0x70a08231" + _pad_address(wallet)
-            raw_bal = await self._rpc_limited(rpc_url, "eth_call", [{"to": token_address, "data": data_balance}, "latest"])
+            meta = self._cached_token_meta(f"{chain}:{token_address.lower()}", time.monotonic())
+            if meta is None:
+                # Cold meta: fetch decimals + symbol + balanceOf in one JSON-RPC batch (one round-trip).
+                raw_dec, raw_sym, raw_bal = await self._rpc_batch_limited(
+                    rpc_url,
+                    [*_token_meta_calls(token_address), balance_call],
+                )
+                meta = await self._get_token_meta(
+                    rpc_url=rpc_url,
+                    chain=chain,
+                    token_address=token_address,
+                    prefetched=(raw_dec, raw_sym),
+                )
+                if isinstance(raw_bal, Exception):
+                    raise raw_bal
+            else:
+                raw_bal = await self._rpc_limited(rpc_url, *balance_call)
             bal_int = _hex_to_int(raw_bal)
 
             qty = (bal_int / (10 ** meta.decimals)) if meta.decimals is not None else None
@@ -347,11 +536,52 @@ class ChainProvider:
             return TokenBalance(quantity=None, symbol=None, decimals=None, source="solana", error=f"{type(e).__name__}: {e}")
 
 
+def _write_token_meta(data: bytes) -> None:
+    try:
+        TOKEN_META_PATH.parent.mkdir(parents=True, exist_ok=True)
+        write_bytes_atomic(TOKEN_META_PATH, data)
+    except OSError:
+        pass  # a missed flush only means refetching that meta after a restart
+
+
+async def _post_json(client: httpx.AsyncClient, rpc_url: str, payload: Any) -> httpx.Response:
+    try:
+        return await client.post(rpc_url, json=payload, headers={"Content-Type": "application/json"})
+    except httpx.TimeoutException as e:
+        # Surface client-side timeouts uniformly as "TimeoutError: rpc timeout" in TokenBalance.error.
+        raise TimeoutError("rpc timeout") from e
+
+
 async def _rpc(client: httpx.AsyncClient, rpc_url: str, method: str, params: list[Any]) -> Any:
     payload = {"jsonrpc": "2.0", "id": 1, "method": method, "params": params}
-    r = await client.post(rpc_url, json=payload, headers={"Content-Type": "application/json"})
+    r = await _post_json(client, rpc_url, payload)
     r.raise_for_status()
     data = r.json()
     if "error" in data:
         raise RuntimeError(str(data["error"]))
     return data.get("result")
+
+
+async def _rpc_batch(client: httpx.AsyncClient, rpc_url: str, calls: list[tuple[str, list[Any]]]) -> list[Any]:
+    """
+    Send several JSON-RPC calls as one batch request.
+    Returns results in call order; a per-call error is returned (not raised) as an Exception instance.
+    """
+    payload = [{"jsonrpc": "2.0", "id": i, "method": method, "params": params} for i, (method, params) in enumerate(calls)]
+    r = await _post_json(client, rpc_url, payload)
+    r.raise_for_status()
+    data = r.json()
+    if isinstance(data, dict):
+        # Some nodes reject the whole batch with a single error object.
+        raise RuntimeError(str(data.get("error") or data))
+    by_id = {it.get("id"): it for it in data if isinstance(it, dict)}
+    out: list[Any] = []
+    for i in range(len(calls)):
+        it = by_id.get(i)
+        if it is None:
+            out.append(RuntimeError("missing result in rpc batch response"))
+        elif "error" in it:
+            out.append(RuntimeError(str(it["error"])))
+        else:
+            out.append(it.get("result"))
+    return out
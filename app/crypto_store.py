@@ -1,26 +1,63 @@
 from __future__ import annotations
 
+import base64
+import os
+from functools import lru_cache
 from pathlib import Path
 
+from cryptography.exceptions import InvalidTag
 from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 
 DATA_DIR = Path(__file__).resolve().parent.parent / "data"
 KEY_PATH = DATA_DIR / "secret.key"
 
+# Token format: urlsafe_b64(version || nonce(12) || ciphertext+tag).
+# Legacy Fernet tokens decode to a leading 0x80 byte and are still accepted by decrypt_str.
+_GCM_VERSION = 0x01
+_FERNET_VERSION = 0x80
+_NONCE_LEN = 12
 
-def _load_or_create_key() -> bytes:
-    DATA_DIR.mkdir(parents=True, exist_ok=True)
-    if KEY_PATH.exists():
-        key = KEY_PATH.read_bytes().strip()
+
+def _load_or_create_key(key_path: Path | None = None) -> bytes:
+    key_path = key_path or KEY_PATH
+    key_path.parent.mkdir(parents=True, exist_ok=True)
+    if key_path.exists():
+        key = key_path.read_bytes().strip()
         if key:
             return key
     key = Fernet.generate_key()
-    KEY_PATH.write_bytes(key)
+    key_path.write_bytes(key)
     return key
 
 
+@lru_cache(maxsize=4)
+def _ciphers_for(key_path: Path) -> tuple[AESGCM, Fernet]:
+    key = _load_or_create_key(key_path)
+    # Derive the AES-256-GCM key from the existing key file so old installs keep a single secret.key.
+    gcm_key = HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=b"permanent-portfolio-tracker/aesgcm/v1",
+    ).derive(base64.urlsafe_b64decode(key))
+    return AESGCM(gcm_key), Fernet(key)
+
+
+def _ciphers() -> tuple[AESGCM, Fernet]:
+    # Keyed on the current KEY_PATH so tests (or a relocated data dir) get their own instance.
+    return _ciphers_for(KEY_PATH)
+
+
 def _fernet() -> Fernet:
-    return Fernet(_load_or_create_key())
+    return _ciphers()[1]
+
+
+def reset_fernet_cache() -> None:
+    """Forget cached key material (call after rotating or replacing the key file)."""
+    _ciphers_for.cache_clear()
 
 
 def encrypt_str(plain: str) -> str:
@@ -29,8 +66,10 @@ def encrypt_str(plain: str) -> str:
     s = str(plain)
     if not s:
         return ""
-    token = _fernet().encrypt(s.encode("utf-8"))
-    return token.decode("ascii")
+    aead, _ = _ciphers()
+    nonce = os.urandom(_NONCE_LEN)
+    ct = aead.encrypt(nonce, s.encode("utf-8"), None)
+    return base64.urlsafe_b64encode(bytes([_GCM_VERSION]) + nonce + ct).decode("ascii")
 
 
 def decrypt_str(token: str) -> str | None:
@@ -38,8 +77,16 @@ def decrypt_str(token: str) -> str | None:
     if not t:
         return None
     try:
-        raw = _fernet().decrypt(t.encode("ascii"))
+        blob = base64.urlsafe_b64decode(t.encode("ascii"))
+        if not blob:
+            return None
+        aead, fernet = _ciphers()
+        if blob[0] == _FERNET_VERSION:
+            raw = fernet.decrypt(t.encode("ascii"))
+        elif blob[0] == _GCM_VERSION and len(blob) > 1 + _NONCE_LEN:
+            raw = aead.decrypt(blob[1 : 1 + _NONCE_LEN], blob[1 + _NONCE_LEN :], None)
+        else:
+            return None
         return raw.decode("utf-8")
-    except (InvalidToken, ValueError):
+    except (InvalidToken, InvalidTag, ValueError):
         return None
-
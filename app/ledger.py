@@ -1,18 +1,22 @@
 from __future__ import annotations
 
-import json
 import math
 import uuid
 from dataclasses import dataclass
 from datetime import date, datetime, time
+from functools import lru_cache
 from pathlib import Path
 from typing import Literal
+from zoneinfo import ZoneInfo
 
-from pydantic import BaseModel, Field
+import orjson
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
 
+from app.fileio import write_bytes_atomic
 from app.portfolio import DATA_DIR
 
-LEDGER_PATH = DATA_DIR / "ledger.json"
+LEDGER_PATH = DATA_DIR / "ledger.jsonl"
+LEGACY_LEDGER_PATH = DATA_DIR / "ledger.json"
 
 
 class LedgerEntry(BaseModel):
@@ -36,51 +40,116 @@ class LedgerEntry(BaseModel):
         return -self.signed_amount()
 
 
-def load_ledger() -> list[LedgerEntry]:
-    DATA_DIR.mkdir(parents=True, exist_ok=True)
-    if not LEDGER_PATH.exists():
-        return []
-    raw = LEDGER_PATH.read_text(encoding="utf-8").strip()
-    if not raw:
-        return []
+_LEDGER_ADAPTER = TypeAdapter(list[LedgerEntry])
+
+
+def _migrate_legacy_ledger() -> None:
+    """One-time conversion of the old single-array ledger.json into append-only ledger.jsonl."""
+    if LEDGER_PATH.exists() or not LEGACY_LEDGER_PATH.exists():
+        return
+    raw = LEGACY_LEDGER_PATH.read_bytes().strip()
     try:
-        data = json.loads(raw)
+        data = orjson.loads(raw) if raw else []
     except Exception:
-        return []
+        return
     if not isinstance(data, list):
+        return
+    save_ledger(_validate_entries(data))
+
+
+def _validate_entries(data: list) -> list[LedgerEntry]:
+    try:
+        # Fast path: validate the whole list in one call.
+        return _LEDGER_ADAPTER.validate_python(data)
+    except ValidationError:
+        # Slow path: keep the valid entries, drop the broken ones.
+        out: list[LedgerEntry] = []
+        for it in data:
+            try:
+                out.append(LedgerEntry.model_validate(it))
+            except Exception:
+                continue
+        return out
+
+
+# Parsed ledger and derived cashflow indexes, keyed on the file's identity (path, mtime, size)
+# so repeated dashboard reads skip parsing/validation until the ledger actually changes.
+_ledger_cache: tuple[tuple, list[LedgerEntry]] | None = None
+_index_cache: tuple[tuple, "CashflowIndex", dict[str, "CashflowIndex"]] | None = None
+
+
+def ledger_file_key() -> tuple | None:
+    """Identity of the ledger file's current contents (path, mtime_ns, size); None if absent."""
+    try:
+        st = LEDGER_PATH.stat()
+    except FileNotFoundError:
+        return None
+    return (str(LEDGER_PATH), st.st_mtime_ns, st.st_size)
+
+
+def load_ledger() -> list[LedgerEntry]:
+    global _ledger_cache
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    _migrate_legacy_ledger()
+    key = ledger_file_key()
+    if key is None:
         return []
-    out: list[LedgerEntry] = []
-    for it in data:
-        try:
-            out.append(LedgerEntry.model_validate(it))
-        except Exception:
-            continue
+    if _ledger_cache is not None and _ledger_cache[0] == key:
+        return list(_ledger_cache[1])
+    out = _read_ledger_file()
+    _ledger_cache = (key, out)
+    return list(out)
+
+
+def _read_ledger_file() -> list[LedgerEntry]:
+    data: list = []
+    with LEDGER_PATH.open("rb") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                data.append(orjson.loads(line))
+            except Exception:
+                # Tolerate a torn trailing line from an interrupted append.
+                continue
+    out = _validate_entries(data)
     out.sort(key=lambda e: e.ts)
     return out
 
 
+def _dump_line(entry: LedgerEntry) -> bytes:
+    return orjson.dumps(entry.model_dump(mode="json")) + b"\n"
+
+
 def save_ledger(entries: list[LedgerEntry]) -> None:
     DATA_DIR.mkdir(parents=True, exist_ok=True)
     entries_sorted = sorted(entries, key=lambda e: e.ts)
-    LEDGER_PATH.write_text(
-        json.dumps([e.model_dump() for e in entries_sorted], ensure_ascii=False, indent=2),
-        encoding="utf-8",
-    )
+    write_bytes_atomic(LEDGER_PATH, b"".join(_dump_line(e) for e in entries_sorted))
+
+
+def _append_entries(entries: list[LedgerEntry]) -> None:
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    _migrate_legacy_ledger()
+    # Entries are sorted on read, so appends need not preserve ts order.
+    with LEDGER_PATH.open("a+b") as f:
+        prefix = b""
+        if f.seek(0, 2) > 0:
+            f.seek(-1, 2)
+            if f.read(1) != b"\n":
+                prefix = b"\n"  # don't glue onto a torn last line
+        f.write(prefix + b"".join(_dump_line(e) for e in entries))
 
 
 def add_ledger_entry(entry: LedgerEntry) -> LedgerEntry:
-    entries = load_ledger()
-    entries.append(entry)
-    save_ledger(entries)
+    _append_entries([entry])
     return entry
 
 
 def add_ledger_entries(new_entries: list[LedgerEntry]) -> None:
     if not new_entries:
         return
-    entries = load_ledger()
-    entries.extend(new_entries)
-    save_ledger(entries)
+    _append_entries(new_entries)
 
 
 def delete_ledger_entry(entry_id: str) -> bool:
@@ -95,10 +164,13 @@ def delete_ledger_entry(entry_id: str) -> bool:
     return True
 
 
-def date_to_epoch_seconds(*, d: date, tz_name: str) -> float:
-    from zoneinfo import ZoneInfo
+@lru_cache(maxsize=8)
+def _zone(tz_name: str) -> ZoneInfo:
+    return ZoneInfo(tz_name)
+
 
-    tz = ZoneInfo(tz_name)
+def date_to_epoch_seconds(*, d: date, tz_name: str) -> float:
+    tz = _zone(tz_name)
     dt = datetime.combine(d, time.min).replace(tzinfo=tz)
     return float(dt.timestamp())
 
@@ -114,24 +186,60 @@ def parse_date_input(*, raw: str, tz_name: str) -> float | None:
     return date_to_epoch_seconds(d=d, tz_name=tz_name)
 
 
-def _xnpv(rate: float, cashflows: list[tuple[float, float]]) -> float:
-    if not cashflows:
+_SECONDS_PER_YEAR = 365.0 * 24.0 * 3600.0
+
+
+def _year_fractions(cashflows: list[tuple[float, float]]) -> list[tuple[float, float]]:
+    """
+    (years since first flow, amount) pairs for sorted cashflows; computed once per xirr() instead of per NPV evaluation.
+    Flows sharing a timestamp (e.g. one batch of rebalance entries) share a discount factor, so they are summed.
+    """
+    t0 = cashflows[0][0]
+    out: list[tuple[float, float]] = []
+    prev_t: float | None = None
+    for t, cf in cashflows:
+        if t == prev_t:
+            out[-1] = (out[-1][0], out[-1][1] + cf)
+        else:
+            out.append(((t - t0) / _SECONDS_PER_YEAR, cf))
+            prev_t = t
+    return out
+
+
+def _xnpv(rate: float, flows: list[tuple[float, float]]) -> float:
+    if not flows:
         return 0.0
     if rate <= -0.999999:
         return math.inf
-    t0 = cashflows[0][0]
+    # (1+r)**-y == exp(-y*log1p(r)): one log per rate, then a cheap exp per flow.
+    k = -math.log1p(rate)
+    exp = math.exp
     out = 0.0
-    for t, cf in cashflows:
-        years = (t - t0) / (365.0 * 24.0 * 3600.0)
-        out += cf / ((1.0 + rate) ** years)
+    for years, cf in flows:
+        out += cf * exp(k * years)
     return out
 
 
-def xirr(cashflows: list[tuple[float, float]]) -> float | None:
+def _xnpv_and_deriv(rate: float, flows: list[tuple[float, float]]) -> tuple[float, float]:
+    """NPV and d(NPV)/d(rate) in a single pass."""
+    base = 1.0 + rate
+    k = -math.log1p(rate)
+    exp = math.exp
+    npv = 0.0
+    d_years = 0.0
+    for years, cf in flows:
+        v = cf * exp(k * years)
+        npv += v
+        d_years += years * v
+    return npv, -d_years / base
+
+
+def xirr(cashflows: list[tuple[float, float]], *, guess: float | None = None) -> float | None:
     """
     Money-weighted annualized return (XIRR).
     Cashflows are (epoch_seconds, amount), positive means cash-in.
     Returns rate as a fraction (e.g. 0.12 = 12%).
+    `guess` (e.g. the previous result for the same asset) seeds Newton when it lies inside the bracket.
     """
     if not cashflows or len(cashflows) < 2:
         return None
@@ -142,10 +250,12 @@ def xirr(cashflows: list[tuple[float, float]]) -> float | None:
     if not (has_pos and has_neg):
         return None
 
+    flows = _year_fractions(cashflows)
+
     lo = -0.9999
     hi = 1.0
-    f_lo = _xnpv(lo, cashflows)
-    f_hi = _xnpv(hi, cashflows)
+    f_lo = _xnpv(lo, flows)
+    f_hi = _xnpv(hi, flows)
 
     # Expand hi until we bracket a root or give up.
     for _ in range(60):
@@ -154,37 +264,43 @@ def xirr(cashflows: list[tuple[float, float]]) -> float | None:
         hi *= 2.0
         if hi > 1e6:
             return None
-        f_hi = _xnpv(hi, cashflows)
+        f_hi = _xnpv(hi, flows)
     else:
         return None
 
-    # Bisection
+    # Safeguarded Newton: take the Newton step when it stays inside the bracket, otherwise bisect.
+    # Staying inside the bracket keeps us on the same root bisection would pick when a ledger with
+    # withdrawals has several, while converging in a handful of steps instead of ~30.
+    if guess is not None and math.isfinite(guess) and lo < guess < hi:
+        x = guess
+    else:
+        x = 0.1 if lo < 0.1 < hi else (lo + hi) / 2.0
     for _ in range(120):
-        mid = (lo + hi) / 2.0
-        f_mid = _xnpv(mid, cashflows)
-        if not math.isfinite(f_mid):
-            hi = mid
+        try:
+            f_x, d_x = _xnpv_and_deriv(x, flows)
+        except (OverflowError, ZeroDivisionError, ValueError):
+            f_x, d_x = math.inf, 0.0
+        if not math.isfinite(f_x):
+            hi = x
+            x = (lo + hi) / 2.0
             continue
-        if abs(f_mid) < 1e-8:
-            return mid
-        if f_lo * f_mid < 0:
-            hi = mid
-            f_hi = f_mid
+        if abs(f_x) < 1e-8:
+            return x
+        if f_lo * f_x < 0:
+            hi = x
+            f_hi = f_x
         else:
-            lo = mid
-            f_lo = f_mid
+            lo = x
+            f_lo = f_x
+        nx = x - f_x / d_x if d_x and math.isfinite(d_x) else lo
+        if not (lo < nx < hi):
+            nx = (lo + hi) / 2.0
+        if abs(nx - x) < 1e-15 * max(1.0, abs(x)) or hi - lo < 1e-15:
+            return nx
+        x = nx
     return (lo + hi) / 2.0
 
 
-def build_cashflows_for_xirr(*, entries: list[LedgerEntry], now_ts: float, final_value: float) -> list[tuple[float, float]]:
-    flows: list[tuple[float, float]] = []
-    for e in entries:
-        flows.append((float(e.ts), float(e.cashflow_for_xirr())))
-    flows.append((float(now_ts), float(final_value)))
-    flows.sort(key=lambda x: x[0])
-    return flows
-
-
 @dataclass(frozen=True)
 class LedgerMetrics:
     principal: float
@@ -194,21 +310,71 @@ class LedgerMetrics:
     start_ts: float | None
 
 
-def compute_metrics(*, entries: list[LedgerEntry], now_ts: float, current_value: float) -> LedgerMetrics:
+@dataclass(frozen=True)
+class CashflowIndex:
+    """Everything compute_metrics needs from a set of entries except the final (now, value) flow."""
+
+    principal: float
+    start_ts: float | None
+    flows: tuple[tuple[float, float], ...]  # sorted by ts, investor perspective
+
+
+def build_cashflow_index(entries: list[LedgerEntry]) -> CashflowIndex:
     principal = 0.0
     start_ts: float | None = None
+    flows: list[tuple[float, float]] = []
     for e in entries:
+        ts = float(e.ts)
         principal += float(e.signed_amount())
-        if start_ts is None or float(e.ts) < start_ts:
-            start_ts = float(e.ts)
+        if start_ts is None or ts < start_ts:
+            start_ts = ts
+        flows.append((ts, float(e.cashflow_for_xirr())))
+    flows.sort(key=lambda x: x[0])
+    return CashflowIndex(principal=principal, start_ts=start_ts, flows=tuple(flows))
+
 
+def load_cashflow_indexes() -> tuple[CashflowIndex, dict[str, CashflowIndex]]:
+    """(whole-ledger index, per-asset_id indexes), rebuilt only when the ledger file changes."""
+    global _index_cache
+    # Checked before load_ledger(): a hit costs one stat. An existing file also means there is nothing to migrate.
+    key = ledger_file_key()
+    if key is not None and _index_cache is not None and _index_cache[0] == key:
+        return _index_cache[1], _index_cache[2]
+    entries = load_ledger()
+    # load_ledger may have created the file (legacy migration).
+    key = ledger_file_key()
+    by_asset: dict[str, list[LedgerEntry]] = {}
+    for e in entries:
+        if e.asset_id:
+            by_asset.setdefault(e.asset_id, []).append(e)
+    total = build_cashflow_index(entries)
+    per_asset = {aid: build_cashflow_index(es) for aid, es in by_asset.items()}
+    if key is not None:
+        _index_cache = (key, total, per_asset)
+    return total, per_asset
+
+
+_EMPTY_INDEX = CashflowIndex(principal=0.0, start_ts=None, flows=())
+
+
+def compute_metrics(
+    *,
+    entries: list[LedgerEntry] | None = None,
+    now_ts: float,
+    current_value: float,
+    index: CashflowIndex | None = None,
+    xirr_guess: float | None = None,
+) -> LedgerMetrics:
+    if index is None:
+        index = build_cashflow_index(entries) if entries else _EMPTY_INDEX
+    principal = index.principal
     current_value = float(current_value or 0.0)
     profit = current_value - principal
 
     rate: float | None = None
     try:
-        flows = build_cashflows_for_xirr(entries=entries, now_ts=now_ts, final_value=current_value)
-        rate = xirr(flows)
+        # flows are pre-sorted; xirr's sort of an already-sorted list is linear.
+        rate = xirr([*index.flows, (float(now_ts), current_value)], guess=xirr_guess)
     except Exception:
         rate = None
 
@@ -217,5 +383,5 @@ def compute_metrics(*, entries: list[LedgerEntry], now_ts: float, current_value:
         current_value=current_value,
         profit=profit,
         xirr_annual=rate,
-        start_ts=start_ts,
+        start_ts=index.start_ts,
     )
@@ -1,33 +1,124 @@
 from __future__ import annotations
 
 import smtplib
+import threading
 from email.message import EmailMessage
 
 from app.settings import Settings
 
 
-def send_email(*, settings: Settings, subject: str, body: str) -> tuple[bool, str | None]:
+def _validate(settings: Settings) -> str | None:
     if not settings.email_enabled:
-        return False, "email disabled"
+        return "email disabled"
     if not settings.smtp_host or not settings.mail_from or not settings.mail_to:
-        return False, "email not configured"
+        return "email not configured"
+    return None
+
 
+def _build_message(*, settings: Settings, subject: str, body: str) -> EmailMessage:
     msg = EmailMessage()
     msg["Subject"] = subject
     msg["From"] = settings.mail_from
     msg["To"] = ", ".join(settings.mail_to)
     msg.set_content(body)
+    return msg
+
+
+def _conn_key(settings: Settings) -> tuple:
+    return (
+        settings.smtp_host,
+        settings.smtp_port,
+        settings.smtp_use_starttls,
+        settings.smtp_username,
+        settings.smtp_password,
+    )
+
 
-    try:
-        with smtplib.SMTP(settings.smtp_host, settings.smtp_port, timeout=20) as smtp:
+class Mailer:
+    """
+    Keeps one logged-in SMTP session and reuses it across sends.
+    The session is re-established when the SMTP settings change or the server has dropped it.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._smtp: smtplib.SMTP | None = None
+        self._key: tuple | None = None
+
+    def _connect(self, settings: Settings) -> smtplib.SMTP:
+        smtp = smtplib.SMTP(settings.smtp_host, settings.smtp_port, timeout=20)
+        try:
             smtp.ehlo()
             if settings.smtp_use_starttls:
                 smtp.starttls()
                 smtp.ehlo()
             if settings.smtp_username and settings.smtp_password:
                 smtp.login(settings.smtp_username, settings.smtp_password)
-            smtp.send_message(msg)
-        return True, None
-    except Exception as e:
-        return False, f"{type(e).__name__}: {e}"
+        except Exception:
+            smtp.close()
+            raise
+        return smtp
+
+    def _drop(self) -> None:
+        smtp, self._smtp, self._key = self._smtp, None, None
+        if smtp is None:
+            return
+        try:
+            smtp.quit()
+        except Exception:
+            smtp.close()
+
+    def _session(self, settings: Settings) -> smtplib.SMTP:
+        key = _conn_key(settings)
+        if self._smtp is not None and self._key == key:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except Exception:
+                pass
+        self._drop()
+        self._smtp = self._connect(settings)
+        self._key = key
+        return self._smtp
+
+    def _send_one(self, settings: Settings, msg: EmailMessage) -> None:
+        try:
+            self._session(settings).send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # Server closed the session between the liveness check and the send; retry once on a fresh one.
+            self._drop()
+            self._session(settings).send_message(msg)
+
+    def send(self, *, settings: Settings, subject: str, body: str) -> tuple[bool, str | None]:
+        return self.send_many(settings=settings, messages=[(subject, body)])[0]
+
+    def send_many(self, *, settings: Settings, messages: list[tuple[str, str]]) -> list[tuple[bool, str | None]]:
+        err = _validate(settings)
+        if err:
+            return [(False, err) for _ in messages]
+
+        out: list[tuple[bool, str | None]] = []
+        with self._lock:
+            for subject, body in messages:
+                try:
+                    self._send_one(settings, _build_message(settings=settings, subject=subject, body=body))
+                    out.append((True, None))
+                except Exception as e:
+                    self._drop()
+                    out.append((False, f"{type(e).__name__}: {e}"))
+        return out
+
+    def close(self) -> None:
+        with self._lock:
+            self._drop()
+
+
+_MAILER = Mailer()
+
+
+def send_email(*, settings: Settings, subject: str, body: str) -> tuple[bool, str | None]:
+    return _MAILER.send(settings=settings, subject=subject, body=body)
+
 
+def close_mailer() -> None:
+    _MAILER.close()
@@ -1,42 +1,59 @@
 from __future__ import annotations
 
 import asyncio
-import json
+import math
 import os
+import sys
 import time
-from dataclasses import asdict
+from dataclasses import asdict, dataclass, replace
 from datetime import datetime
+from pathlib import Path
 from typing import Literal
+from zoneinfo import ZoneInfo
 
+import orjson
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
 from pydantic import BaseModel
 
 from app.chain import ChainProvider
+from app.crypto_store import encrypt_str
 from app.ledger import (
+    CashflowIndex,
     LedgerEntry,
+    LedgerMetrics,
     add_ledger_entry,
     add_ledger_entries,
     compute_metrics,
     delete_ledger_entry,
+    ledger_file_key,
+    load_cashflow_indexes,
     load_ledger,
     parse_date_input,
 )
-from app.mailer import send_email
+from app.mailer import close_mailer, send_email
 from app.notifications import load_notification_state, save_notification_state, should_send_threshold
 from app.portfolio import (
     Portfolio,
     PortfolioAsset,
     PORTFOLIO_PATH,
     load_portfolio,
-    save_portfolio,
+    write_portfolio_dump,
 )
 from app.quotes import QuoteProvider
 from app.rebalance import CategoryView, PortfolioView, compute_portfolio_view
+from app.rebalance_suggest import compute_contribution_suggestion, compute_full_balance_cash_needed
 from app.runtime_cache import PortfolioRuntimeCache
 from app.scheduler import first_workday_of_month_cn, format_email_body
-from app.scheduler import maybe_send_threshold_email_for_view, start_scheduler
-from app.settings import Settings, SettingsOverride, effective_settings_dict, load_settings_override, save_settings_override
+from app.scheduler import maybe_send_threshold_email_for_view, start_scheduler, warnings_hash
+from app.settings import (
+    Settings,
+    SettingsOverride,
+    effective_settings_dict,
+    load_settings_override,
+    save_settings_override,
+    settings_override_key,
+)
 from app.snapshots import maybe_append_snapshot
 from app.snapshots import SNAPSHOT_PATH
 from app.total_history import build_total_history_payload, load_total_history_points, parse_window_seconds
@@ -46,37 +63,60 @@ app = FastAPI(title="Permanent Portfolio Tracker")
 quotes = QuoteProvider()
 chain = ChainProvider()
 settings = Settings.load()
+
+# Timezone objects by name; keyed on the name so a settings change needs no explicit invalidation.
+_TZ_CACHE: dict[str, ZoneInfo] = {}
+
+
+def _tz() -> ZoneInfo:
+    name = settings.timezone
+    tz = _TZ_CACHE.get(name)
+    if tz is None:
+        tz = _TZ_CACHE[name] = ZoneInfo(name)
+    return tz
+
+
 _scheduler = None
 _cache_task: asyncio.Task | None = None
+_portfolio_save_task: asyncio.Task | None = None
+_request_refresh_task: asyncio.Task | None = None
+_triggered_refresh_task: asyncio.Task | None = None
+_refresh_again = False
+# Resolved when the running refresh_runtime_cache finishes; forced callers wait on it instead of returning early.
+_refresh_done: asyncio.Future[None] | None = None
 runtime_cache = PortfolioRuntimeCache()
 
 def _env_float(name: str, default: float) -> float:
+    v = os.environ.get(name)
+    if v is None or not v.strip():
+        return default
     try:
-        v = os.environ.get(name)
-        if v is None:
-            return default
-        s = v.strip()
-        return float(s) if s else default
-    except Exception:
+        # float() tolerates surrounding whitespace on its own.
+        return float(v)
+    except ValueError:
         return default
 
 
-def _env_int(name: str, default: int) -> int:
-    try:
-        v = os.environ.get(name)
-        if v is None:
-            return default
-        s = v.strip()
-        return int(s) if s else default
-    except Exception:
-        return default
+@dataclass(frozen=True, slots=True)
+class CacheTunables:
+    active_refresh_seconds: float
+    idle_refresh_seconds: float
+    idle_after_seconds: float
+    snapshot_interval_seconds: float
+    min_refresh_gap_seconds: float
+
+    @staticmethod
+    def load() -> "CacheTunables":
+        return CacheTunables(
+            active_refresh_seconds=max(1.0, _env_float("PP_CACHE_ACTIVE_REFRESH_SECONDS", 4.0)),
+            idle_refresh_seconds=max(2.0, _env_float("PP_CACHE_IDLE_REFRESH_SECONDS", 20.0)),
+            idle_after_seconds=max(5.0, _env_float("PP_CACHE_IDLE_AFTER_SECONDS", 60.0)),
+            snapshot_interval_seconds=max(10.0, _env_float("PP_SNAPSHOT_INTERVAL_SECONDS", 60.0)),
+            min_refresh_gap_seconds=max(0.25, _env_float("PP_CACHE_MIN_REFRESH_GAP_SECONDS", 1.0)),
+        )
 
 
-_CACHE_ACTIVE_REFRESH_INTERVAL_SECONDS = max(1.0, _env_float("PP_CACHE_ACTIVE_REFRESH_SECONDS", 4.0))
-_CACHE_IDLE_REFRESH_INTERVAL_SECONDS = max(2.0, _env_float("PP_CACHE_IDLE_REFRESH_SECONDS", 20.0))
-_CACHE_IDLE_AFTER_SECONDS = max(5.0, _env_float("PP_CACHE_IDLE_AFTER_SECONDS", 60.0))
-_CACHE_SNAPSHOT_INTERVAL_SECONDS = max(10.0, _env_float("PP_SNAPSHOT_INTERVAL_SECONDS", 60.0))
-_CACHE_MIN_REFRESH_GAP_SECONDS = max(0.25, _env_float("PP_CACHE_MIN_REFRESH_GAP_SECONDS", 1.0))
+cache_tunables = CacheTunables.load()
 
 class ApiMoveRequest(BaseModel):
     category_id: str | None = None
@@ -150,6 +190,14 @@ class ApiSettingsUpdateRequest(BaseModel):
     smtp_use_starttls: bool | None = None
 
 
+def _norm(raw: str | None, *, lower: bool = False) -> str | None:
+    s = raw.strip() if raw else ""
+    if not s:
+        return None
+    # Lowercased values are identifiers from a small set (chain, coingecko id); intern them.
+    return sys.intern(s.lower()) if lower else s
+
+
 def _parse_optional_float(raw: str) -> float | None:
     s = (raw or "").strip()
     if not s:
@@ -178,7 +226,7 @@ def _parse_optional_nonneg_float(raw: str) -> float | None:
 
 
 def _coerce_prefill_assets(raw: object) -> dict[str, float]:
-    if not isinstance(raw, dict):
+    if not raw or not isinstance(raw, dict):
         return {}
     out: dict[str, float] = {}
     for k, v in raw.items():
@@ -217,7 +265,7 @@ def _sanitize_settings_override_for_ui(override: SettingsOverride) -> dict:
 @app.middleware("http")
 async def _track_access_middleware(request: Request, call_next):
     # Used to reduce background refresh work when no one is using the UI.
-    runtime_cache.last_access_at = datetime.now()
+    runtime_cache.last_access_mono = time.monotonic()
     return await call_next(request)
 
 
@@ -238,16 +286,36 @@ async def api_ui_state() -> JSONResponse:
         # Do not block UI; background refresh will populate the cache soon.
         trigger_cache_refresh(force=True)
 
+    if runtime_cache.portfolio_dump is None or runtime_cache.portfolio_dump_version != portfolio.version:
+        runtime_cache.portfolio_dump = portfolio.model_dump()
+        runtime_cache.portfolio_dump_version = portfolio.version
+    if view is not None and runtime_cache.view_dump_for is not view:
+        runtime_cache.view_dump = view.to_dict()
+        runtime_cache.view_dump_for = view
+
+    # UI polls this endpoint; reuse the encoded body while nothing in it has changed.
+    state_key = (portfolio.version, runtime_cache.updated_at, runtime_cache.last_duration_ms, runtime_cache.last_error)
+    if (
+        runtime_cache.ui_state_body is not None
+        and runtime_cache.ui_state_key == state_key
+        and runtime_cache.ui_state_view is view
+    ):
+        return Response(content=runtime_cache.ui_state_body, media_type="application/json")
+
     payload = {
-        "portfolio": portfolio.model_dump(),
-        "view": asdict(view) if view is not None else None,
+        "portfolio": runtime_cache.portfolio_dump,
+        "view": runtime_cache.view_dump if view is not None else None,
         "cache": {
             "updated_at": runtime_cache.updated_at.isoformat() if runtime_cache.updated_at else None,
             "last_duration_ms": runtime_cache.last_duration_ms,
             "last_error": runtime_cache.last_error,
         },
     }
-    return JSONResponse(payload)
+    body = orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+    runtime_cache.ui_state_key = state_key
+    runtime_cache.ui_state_view = view
+    runtime_cache.ui_state_body = body
+    return Response(content=body, media_type="application/json")
 
 
 @app.get("/api/v2/state")
@@ -272,17 +340,17 @@ def _coerce_bucket_weight(value: float | None) -> float | None:
 
 @app.post("/api/v2/assets")
 async def api_v2_assets_create(req: ApiAssetCreateRequest) -> JSONResponse:
-    portfolio = load_portfolio()
+    portfolio = _editable_portfolio()
 
     kind = (req.kind or "cn").strip().lower()
     bw = _coerce_bucket_weight(req.bucket_weight)
-    cat = (req.category_id or "").strip() or None
+    cat = _norm(req.category_id)
 
     if kind == "cn":
         asset = PortfolioAsset(
             kind="cn",
-            code=(req.code or "").strip(),
-            name=(req.name or "").strip(),
+            code=_norm(req.code) or "",
+            name=_norm(req.name) or "",
             quantity=max(0.0, float(req.quantity or 0.0)),
             category_id=cat,
             bucket_weight=bw,
@@ -290,11 +358,11 @@ async def api_v2_assets_create(req: ApiAssetCreateRequest) -> JSONResponse:
     elif kind == "crypto":
         asset = PortfolioAsset(
             kind="crypto",
-            name=(req.name or "").strip(),
-            chain=(req.chain or "").strip().lower() or None,
-            wallet=(req.wallet or "").strip() or None,
-            token_address=(req.token_address or "").strip() or None,
-            coingecko_id=(req.coingecko_id or "").strip().lower() or None,
+            name=_norm(req.name) or "",
+            chain=_norm(req.chain, lower=True),
+            wallet=_norm(req.wallet),
+            token_address=_norm(req.token_address),
+            coingecko_id=_norm(req.coingecko_id, lower=True),
             manual_quantity=(max(0.0, float(req.manual_quantity)) if req.manual_quantity is not None else None),
             category_id=cat,
             bucket_weight=bw,
@@ -302,7 +370,7 @@ async def api_v2_assets_create(req: ApiAssetCreateRequest) -> JSONResponse:
     elif kind == "cash":
         asset = PortfolioAsset(
             kind="cash",
-            name=((req.name or "").strip() or "现金"),
+            name=_norm(req.name) or "现金",
             cash_amount_cny=max(0.0, float(req.cash_amount_cny or 0.0)),
             category_id=(cat or "cash"),
             bucket_weight=bw,
@@ -311,7 +379,7 @@ async def api_v2_assets_create(req: ApiAssetCreateRequest) -> JSONResponse:
         return JSONResponse({"ok": False, "error": "invalid kind"}, status_code=400)
 
     portfolio.assets.append(asset)
-    save_portfolio(portfolio)
+    _commit_portfolio(portfolio)
     trigger_cache_refresh(force=True)
     return JSONResponse({"ok": True, "asset": asset.model_dump()})
 
@@ -322,19 +390,15 @@ async def api_v2_assets_update(asset_id: str, req: ApiAssetUpdateRequest) -> JSO
     if not asset_id:
         return JSONResponse({"ok": False, "error": "missing asset_id"}, status_code=400)
 
-    portfolio = load_portfolio()
-    target: PortfolioAsset | None = None
-    for a in portfolio.assets:
-        if a.id == asset_id:
-            target = a
-            break
+    portfolio = _editable_portfolio()
+    target = portfolio.assets_by_id.get(asset_id)
     if target is None:
         return JSONResponse({"ok": False, "error": "asset not found"}, status_code=404)
 
     fs = set(req.model_fields_set)
     _apply_asset_patch(target=target, req=req, fields_set=fs)
 
-    save_portfolio(portfolio)
+    _commit_portfolio(portfolio)
     trigger_cache_refresh(force=True)
     return JSONResponse({"ok": True, "asset": target.model_dump()})
 
@@ -344,51 +408,51 @@ def _apply_asset_patch(*, target: PortfolioAsset, req: ApiAssetUpdateRequest, fi
 
     if target.kind == "cn":
         if "code" in fs:
-            target.code = (req.code or "").strip()
+            target.code = _norm(req.code) or ""
         if "name" in fs:
-            target.name = (req.name or "").strip()
+            target.name = _norm(req.name) or ""
         if "quantity" in fs and req.quantity is not None:
             target.quantity = max(0.0, float(req.quantity))
         if "category_id" in fs:
-            target.category_id = (req.category_id or "").strip() or None
+            target.category_id = _norm(req.category_id)
         if "bucket_weight" in fs:
             target.bucket_weight = _coerce_bucket_weight(req.bucket_weight)
         return
 
     if target.kind == "crypto":
         if "name" in fs:
-            target.name = (req.name or "").strip()
+            target.name = _norm(req.name) or ""
         if "chain" in fs:
-            target.chain = (req.chain or "").strip().lower() or None
+            target.chain = _norm(req.chain, lower=True)
         if "wallet" in fs:
-            target.wallet = (req.wallet or "").strip() or None
+            target.wallet = _norm(req.wallet)
         if "token_address" in fs:
-            target.token_address = (req.token_address or "").strip() or None
+            target.token_address = _norm(req.token_address)
         if "coingecko_id" in fs:
-            target.coingecko_id = (req.coingecko_id or "").strip().lower() or None
+            target.coingecko_id = _norm(req.coingecko_id, lower=True)
         if "manual_quantity" in fs:
             target.manual_quantity = max(0.0, float(req.manual_quantity)) if req.manual_quantity is not None else None
         if "category_id" in fs:
-            target.category_id = (req.category_id or "").strip() or None
+            target.category_id = _norm(req.category_id)
         if "bucket_weight" in fs:
             target.bucket_weight = _coerce_bucket_weight(req.bucket_weight)
         return
 
     if target.kind == "cash":
         if "name" in fs:
-            target.name = (req.name or "").strip() or "现金"
+            target.name = _norm(req.name) or "现金"
         if "cash_amount_cny" in fs and req.cash_amount_cny is not None:
             target.cash_amount_cny = max(0.0, float(req.cash_amount_cny))
         if "category_id" in fs:
-            target.category_id = ((req.category_id or "").strip() or "cash")
+            target.category_id = _norm(req.category_id) or "cash"
         if "bucket_weight" in fs:
             target.bucket_weight = _coerce_bucket_weight(req.bucket_weight)
 
 
 @app.post("/api/v2/assets/batch")
 async def api_v2_assets_batch_update(items: list[ApiAssetBatchUpdateItem]) -> JSONResponse:
-    portfolio = load_portfolio()
-    assets_by_id = {a.id: a for a in portfolio.assets}
+    portfolio = _editable_portfolio()
+    assets_by_id = portfolio.assets_by_id
 
     updated: list[str] = []
     not_found: list[str] = []
@@ -408,7 +472,7 @@ async def api_v2_assets_batch_update(items: list[ApiAssetBatchUpdateItem]) -> JS
         updated.append(asset_id)
 
     if updated:
-        save_portfolio(portfolio)
+        _commit_portfolio(portfolio)
         trigger_cache_refresh(force=True)
     return JSONResponse({"ok": True, "updated": updated, "not_found": not_found})
 
@@ -418,12 +482,11 @@ async def api_v2_assets_delete(asset_id: str) -> JSONResponse:
     asset_id = (asset_id or "").strip()
     if not asset_id:
         return JSONResponse({"ok": False, "error": "missing asset_id"}, status_code=400)
-    portfolio = load_portfolio()
-    before = len(portfolio.assets)
-    portfolio.assets = [a for a in portfolio.assets if a.id != asset_id]
-    if len(portfolio.assets) == before:
+    portfolio = _editable_portfolio()
+    if asset_id not in portfolio.assets_by_id:
         return JSONResponse({"ok": False, "error": "asset not found"}, status_code=404)
-    save_portfolio(portfolio)
+    portfolio.assets = [a for a in portfolio.assets if a.id != asset_id]
+    _commit_portfolio(portfolio)
     trigger_cache_refresh(force=True)
     return JSONResponse({"ok": True})
 
@@ -433,16 +496,12 @@ async def api_v2_assets_move(asset_id: str, req: ApiMoveRequest) -> JSONResponse
     asset_id = (asset_id or "").strip()
     if not asset_id:
         return JSONResponse({"ok": False, "error": "missing asset_id"}, status_code=400)
-    portfolio = load_portfolio()
-    moved = False
-    for a in portfolio.assets:
-        if a.id == asset_id:
-            a.category_id = (req.category_id or "").strip() or None
-            moved = True
-            break
-    if not moved:
+    portfolio = _editable_portfolio()
+    target = portfolio.assets_by_id.get(asset_id)
+    if target is None:
         return JSONResponse({"ok": False, "error": "asset not found"}, status_code=404)
-    save_portfolio(portfolio)
+    target.category_id = _norm(req.category_id)
+    _commit_portfolio(portfolio)
     trigger_cache_refresh(force=True)
     return JSONResponse({"ok": True})
 
@@ -463,57 +522,71 @@ async def api_total_history(request: Request) -> JSONResponse:
     # Cache points in memory to avoid re-parsing snapshots.jsonl on every page load.
     # Snapshots append at most once per minute, so a short cache TTL is safe.
     now_epoch = time.time()
-    snap_mtime = SNAPSHOT_PATH.stat().st_mtime if SNAPSHOT_PATH.exists() else None
+    snap_mtime = _mtime(SNAPSHOT_PATH)
     cache_key = f"{seconds}:{max_points}"
-    points = None
-    try:
-        if (
-            runtime_cache.total_history_key == cache_key
-            and runtime_cache.total_history_points is not None
-            and runtime_cache.total_history_snap_mtime == snap_mtime
-            and runtime_cache.total_history_loaded_at is not None
-            and (now_epoch - runtime_cache.total_history_loaded_at) < 10.0
-        ):
-            points = runtime_cache.total_history_points
-    except Exception:
-        points = None
-
-    if points is None:
+    cached = runtime_cache.total_history_points.get(cache_key)
+    if cached is not None and cached[0] == snap_mtime and (now_epoch - cached[1]) < 10.0:
+        _, loaded_at, points = cached
+    else:
         points = load_total_history_points(path=SNAPSHOT_PATH, since_seconds=seconds, max_points=max_points)
-        runtime_cache.total_history_key = cache_key
-        runtime_cache.total_history_points = points
-        runtime_cache.total_history_loaded_at = now_epoch
-        runtime_cache.total_history_snap_mtime = snap_mtime
+        loaded_at = now_epoch
+        runtime_cache.total_history_points[cache_key] = (snap_mtime, loaded_at, points)
 
     current_total = float(runtime_cache.view.total_value) if runtime_cache.view is not None else None
-    payload = build_total_history_payload(points=points, current_value=current_total, window=window)
-    return JSONResponse(payload)
+    # Polling clients hit the same (points, current value) repeatedly; reuse the encoded body.
+    body_key = (
+        window,
+        cache_key,
+        loaded_at,
+        runtime_cache.snapshot_last_epoch,
+        current_total,
+    )
+    body = runtime_cache.total_history_bodies.get(body_key)
+    if body is None:
+        payload = build_total_history_payload(points=points, current_value=current_total, window=window)
+        body = orjson.dumps(payload)
+        runtime_cache.total_history_bodies[body_key] = body
+    return Response(content=body, media_type="application/json")
 
 
 @app.get("/api/ui/ledger-days")
 async def api_ui_ledger_days(request: Request) -> JSONResponse:
-    from zoneinfo import ZoneInfo
-
     portfolio = get_portfolio_cached()
-    tz = ZoneInfo(settings.timezone)
-    entries = load_ledger()
+    tz = _tz()
     manage = request.query_params.get("manage", "").strip().lower() in {"1", "true", "yes", "y", "on"}
 
+    # The aggregate only depends on the ledger file, portfolio state, timezone and (for manage) the
+    # view used for asset names; serve it from cache until one of those changes.
+    cache_key = (
+        ledger_file_key(),
+        portfolio.version,
+        settings.timezone,
+        id(runtime_cache.view) if manage else None,
+    )
+    cached = runtime_cache.ledger_days_cache.get(manage)
+    if cached is not None and cached[0] == cache_key:
+        return Response(content=cached[1], media_type="application/json")
+    entries = load_ledger()
+
+    # Batched entries (e.g. one allocation apply) share a timestamp; format each distinct ts once.
+    # Offset arithmetic on ts would be wrong across DST transitions, so datetime still does the conversion.
+    day_by_ts: dict[float, str] = {}
+
     def _fmt_day(ts: float) -> str:
-        try:
-            return datetime.fromtimestamp(float(ts), tz=tz).date().isoformat()
-        except Exception:
-            return ""
+        day = day_by_ts.get(ts)
+        if day is None:
+            try:
+                day = datetime.fromtimestamp(float(ts), tz=tz).date().isoformat()
+            except Exception:
+                day = ""
+            day_by_ts[ts] = day
+        return day
 
     asset_name_by_id: dict[str, str] = {}
     if manage:
         view = runtime_cache.view
         if view is not None:
-            view_assets = []
-            for c in view.categories:
-                view_assets.extend(c.assets)
-            view_assets.extend(view.unassigned)
-            for av in view_assets:
+            for av in view.flat_assets:
                 try:
                     name = (getattr(av, "name", "") or getattr(av, "code", "") or getattr(av, "coingecko_id", "") or getattr(av, "id", "")).strip()
                 except Exception:
@@ -526,8 +599,10 @@ async def api_ui_ledger_days(request: Request) -> JSONResponse:
             name = (a.name or a.code or a.coingecko_id or a.id).strip()
             asset_name_by_id[a.id] = name
 
-    category_name_by_id = {c.id: c.name for c in portfolio.categories}
-    asset_category_by_id = {a.id: (a.category_id.strip() if a.category_id else None) for a in portfolio.assets}
+    category_name_by_id = portfolio.category_name_by_id
+    asset_category_by_id = portfolio.asset_category_by_id
+
+    categories = tuple((c.id, c.name) for c in portfolio.categories)
 
     running_principal = 0.0
     day_map: dict[str, dict] = {}
@@ -544,23 +619,27 @@ async def api_ui_ledger_days(request: Request) -> JSONResponse:
                 "withdraw_total": 0.0,
                 "net_total": 0.0,
                 "running_principal_end": 0.0,
-                "buckets": [{"id": c.id, "name": c.name, "deposit": 0.0, "withdraw": 0.0, "net": 0.0} for c in portfolio.categories],
+                "buckets": [],
+                # Keyed by category id while aggregating; flattened into "buckets" before responding.
+                "buckets_by_id": {cid: {"id": cid, "name": cname, "deposit": 0.0, "withdraw": 0.0, "net": 0.0} for cid, cname in categories},
                 "other": {"deposit": 0.0, "withdraw": 0.0, "net": 0.0},
             }
             if manage:
                 g["entries"] = []
             day_map[day] = g
 
-        signed = float(e.signed_amount())
+        amount = float(e.amount_cny)
+        is_deposit = e.direction == "deposit"
+        signed = amount if is_deposit else -amount
         running_principal += signed
 
         g["entry_count"] += 1
         g["net_total"] += signed
         g["running_principal_end"] = running_principal
-        if e.direction == "deposit":
-            g["deposit_total"] += float(e.amount_cny)
+        if is_deposit:
+            g["deposit_total"] += amount
         else:
-            g["withdraw_total"] += float(e.amount_cny)
+            g["withdraw_total"] += amount
 
         if manage:
             g["entries"].append(
@@ -568,43 +647,38 @@ async def api_ui_ledger_days(request: Request) -> JSONResponse:
                     "id": e.id,
                     "date": day,
                     "direction": e.direction,
-                    "amount_cny": float(e.amount_cny),
+                    "amount_cny": amount,
                     "asset_id": e.asset_id,
-                    "asset_name": (asset_name_by_id.get(e.asset_id or "", "（组合层）") if e.asset_id else "（组合层）"),
+                    "asset_name": (asset_name_by_id.get(e.asset_id, "（组合层）") if e.asset_id else "（组合层）"),
                     "note": (e.note or "").strip(),
                 }
             )
 
-        cat_id = asset_category_by_id.get(e.asset_id or "") if e.asset_id else None
+        cat_id = asset_category_by_id.get(e.asset_id) if e.asset_id else None
         if cat_id and cat_id in category_name_by_id:
-            b = None
-            for it in g["buckets"]:
-                if it.get("id") == cat_id:
-                    b = it
-                    break
-            if b is not None:
-                if e.direction == "deposit":
-                    b["deposit"] += float(e.amount_cny)
-                else:
-                    b["withdraw"] += float(e.amount_cny)
-                b["net"] += signed
+            b = g["buckets_by_id"].get(cat_id)
+            if b is None:
+                continue
         else:
-            if e.direction == "deposit":
-                g["other"]["deposit"] += float(e.amount_cny)
-            else:
-                g["other"]["withdraw"] += float(e.amount_cny)
-            g["other"]["net"] += signed
+            b = g["other"]
+        if is_deposit:
+            b["deposit"] += amount
+        else:
+            b["withdraw"] += amount
+        b["net"] += signed
 
+    for g in day_map.values():
+        g["buckets"] = list(g.pop("buckets_by_id").values())
     days = sorted(day_map.values(), key=lambda x: x.get("date") or "", reverse=True)
-    return JSONResponse({"days": days})
+    body = orjson.dumps({"days": days}, option=orjson.OPT_NON_STR_KEYS)
+    runtime_cache.ledger_days_cache[manage] = (cache_key, body)
+    return Response(content=body, media_type="application/json")
 
 
 @app.post("/api/v2/ledger")
 async def api_v2_ledger_add(req: ApiLedgerCreateRequest) -> JSONResponse:
-    from zoneinfo import ZoneInfo
-
     tz_name = settings.timezone
-    tz = ZoneInfo(tz_name)
+    tz = _tz()
 
     ts = parse_date_input(raw=(req.date or ""), tz_name=tz_name)
     if ts is None:
@@ -634,10 +708,24 @@ async def api_v2_ledger_delete(entry_id: str) -> JSONResponse:
     return JSONResponse({"ok": True})
 
 
+def _memo_metrics(
+    asset_id: str | None, *, index: CashflowIndex | None, now_ts: float, current_value: float
+) -> LedgerMetrics:
+    # XIRR is the expensive part; reuse it while the value stays within a cent and now_ts within ~100s.
+    memo_key = (asset_id, round(current_value, 2), round(now_ts, -2))
+    m = runtime_cache.metrics_cache.get(memo_key)
+    if m is not None:
+        return replace(m, current_value=current_value, profit=current_value - m.principal)
+    # On a miss the previous rate for the same asset is a good Newton starting point.
+    m = compute_metrics(index=index, now_ts=now_ts, current_value=current_value, xirr_guess=runtime_cache.xirr_guess.get(asset_id))
+    runtime_cache.metrics_cache[memo_key] = m
+    if m.xirr_annual is not None:
+        runtime_cache.xirr_guess[asset_id] = m.xirr_annual
+    return m
+
+
 @app.get("/api/v2/ledger/metrics")
 async def api_v2_ledger_metrics() -> JSONResponse:
-    from zoneinfo import ZoneInfo
-
     portfolio = get_portfolio_cached()
     view = runtime_cache.view
     if view is None:
@@ -646,28 +734,25 @@ async def api_v2_ledger_metrics() -> JSONResponse:
     if view is None:
         view = _empty_view(portfolio, "行情缓存尚未就绪，请稍后刷新页面。")
 
-    tz = ZoneInfo(settings.timezone)
+    tz = _tz()
     now_ts = float(datetime.now(tz=tz).timestamp())
-    entries = load_ledger()
+    total_index, index_by_asset_id = load_cashflow_indexes()
 
-    total_metrics = compute_metrics(entries=entries, now_ts=now_ts, current_value=float(view.total_value))
+    # Per-asset metrics only change with the ledger file; drop memoized results when it changes.
+    file_key = ledger_file_key()
+    if runtime_cache.metrics_cache_for != file_key:
+        runtime_cache.metrics_cache.clear()
+        runtime_cache.metrics_cache_for = file_key
 
-    entries_by_asset_id: dict[str, list[LedgerEntry]] = {}
-    for e in entries:
-        if e.asset_id:
-            entries_by_asset_id.setdefault(e.asset_id, []).append(e)
+    total_metrics = _memo_metrics(None, index=total_index, now_ts=now_ts, current_value=float(view.total_value))
 
-    view_assets = []
-    for c in view.categories:
-        view_assets.extend(c.assets)
-    view_assets.extend(view.unassigned)
-    asset_view_by_id = {a.id: a for a in view_assets}
+    asset_view_by_id = view.assets_by_id
 
     per_asset = []
     for a in portfolio.assets:
         av = asset_view_by_id.get(a.id)
         current_value = float(av.value) if av is not None else 0.0
-        m = compute_metrics(entries=entries_by_asset_id.get(a.id, []), now_ts=now_ts, current_value=current_value)
+        m = _memo_metrics(a.id, index=index_by_asset_id.get(a.id), now_ts=now_ts, current_value=current_value)
         name = (av.name if av and av.name else (a.name or a.code or a.coingecko_id or a.id)).strip()
         per_asset.append(
             {
@@ -682,7 +767,7 @@ async def api_v2_ledger_metrics() -> JSONResponse:
             }
         )
 
-    return JSONResponse({"currency": "CNY", "now_ts": now_ts, "total": asdict(total_metrics), "per_asset": per_asset})
+    return ORJSONResponse({"currency": "CNY", "now_ts": now_ts, "total": asdict(total_metrics), "per_asset": per_asset})
 
 
 @app.get("/api/v2/rebalance/balance-needed")
@@ -695,8 +780,6 @@ async def api_v2_rebalance_balance_needed() -> JSONResponse:
     if view is None:
         view = _empty_view(portfolio, "行情缓存尚未就绪，请稍后刷新页面。")
 
-    from app.rebalance_suggest import compute_full_balance_cash_needed
-
     need = compute_full_balance_cash_needed(view=view)
     return JSONResponse({"balance_needed_cny": float(need)})
 
@@ -712,12 +795,10 @@ async def api_v2_allocation_suggest(contribution: float = 0.0, prefill: str | No
     if view is None:
         view = _empty_view(portfolio, "行情缓存尚未就绪，请稍后刷新页面。")
 
-    from app.rebalance_suggest import compute_contribution_suggestion
-
     prefill_assets = {}
     if prefill:
         try:
-            prefill_assets = _coerce_prefill_assets(json.loads(prefill))
+            prefill_assets = _coerce_prefill_assets(orjson.loads(prefill))
         except Exception:
             return JSONResponse({"ok": False, "error": "invalid prefill"}, status_code=400)
 
@@ -726,7 +807,7 @@ async def api_v2_allocation_suggest(contribution: float = 0.0, prefill: str | No
         contribution_amount_cny=contribution,
         prefill_assets=prefill_assets,
     )
-    payload = asdict(suggestion)
+    payload = suggestion.to_dict()
     payload["ok"] = True
     return JSONResponse(payload)
 
@@ -747,11 +828,7 @@ async def api_v2_crypto_snapshot() -> JSONResponse:
             manual_map[a.id] = a.manual_quantity is not None
 
     assets: dict[str, float] = {}
-    view_assets = []
-    for c in view.categories:
-        view_assets.extend(c.assets)
-    view_assets.extend(view.unassigned)
-    for av in view_assets:
+    for av in view.flat_assets:
         if av.kind != "crypto":
             continue
         if manual_map.get(av.id):
@@ -759,7 +836,7 @@ async def api_v2_crypto_snapshot() -> JSONResponse:
         val = float(av.value or 0.0)
         if val <= 0:
             continue
-        assets[str(av.id)] = val
+        assets[av.id] = val
 
     return JSONResponse({"ok": True, "ts": time.time(), "assets": assets})
 
@@ -773,7 +850,7 @@ async def api_v2_allocation_suggest_after_crypto(
 ) -> JSONResponse:
     contribution = max(0.0, float(contribution or 0.0))
     portfolio = get_portfolio_cached()
-    await refresh_runtime_cache(force=True)
+    await _refresh_for_request()
     view = runtime_cache.view
     if view is None:
         view = _empty_view(portfolio, "行情缓存尚未就绪，请稍后刷新页面。")
@@ -786,14 +863,14 @@ async def api_v2_allocation_suggest_after_crypto(
     baseline_assets = {}
     if baseline:
         try:
-            baseline_assets = _coerce_prefill_assets(json.loads(baseline))
+            baseline_assets = _coerce_prefill_assets(orjson.loads(baseline))
         except Exception:
             return JSONResponse({"ok": False, "error": "invalid baseline"}, status_code=400)
 
     expected_assets = {}
     if expected:
         try:
-            expected_assets = _coerce_prefill_assets(json.loads(expected))
+            expected_assets = _coerce_prefill_assets(orjson.loads(expected))
         except Exception:
             return JSONResponse({"ok": False, "error": "invalid expected"}, status_code=400)
 
@@ -805,12 +882,7 @@ async def api_v2_allocation_suggest_after_crypto(
 
     prefill_assets: dict[str, float] = {}
     prefill_total = 0.0
-    view_assets = []
-    for c in view.categories:
-        view_assets.extend(c.assets)
-    view_assets.extend(view.unassigned)
-
-    for av in view_assets:
+    for av in view.flat_assets:
         if av.kind != "crypto":
             continue
         if manual_map.get(av.id):
@@ -818,7 +890,7 @@ async def api_v2_allocation_suggest_after_crypto(
         val = float(av.value or 0.0)
         if val <= 0:
             continue
-        asset_id = str(av.id)
+        asset_id = av.id
         base = float(baseline_assets.get(asset_id, 0.0))
         delta = val - base
         if delta <= 0:
@@ -842,15 +914,13 @@ async def api_v2_allocation_suggest_after_crypto(
 
     remaining = max(0.0, contribution - prefill_total)
 
-    from app.rebalance_suggest import compute_contribution_suggestion
-
     suggestion = compute_contribution_suggestion(
         view=view,
         contribution_amount_cny=remaining,
         prefill_assets=prefill_assets,
         prefill_in_view=True,
     )
-    payload = asdict(suggestion)
+    payload = suggestion.to_dict()
     payload["ok"] = True
     payload["prefill_assets"] = prefill_assets
     payload["prefill_total"] = prefill_total
@@ -864,13 +934,11 @@ async def api_v2_allocation_suggest_after_crypto(
 
 @app.post("/api/v2/allocation/apply")
 async def api_v2_allocation_apply(req: ApiAllocationApplyRequest) -> JSONResponse:
-    from zoneinfo import ZoneInfo
-
     contribution = max(0.0, float(req.contribution or 0.0))
     if contribution <= 0:
         return JSONResponse({"ok": False, "error": "contribution must be > 0"}, status_code=400)
 
-    portfolio = load_portfolio()
+    portfolio = get_portfolio_cached()
     view = runtime_cache.view
     if view is None:
         await refresh_runtime_cache(force=True)
@@ -878,12 +946,10 @@ async def api_v2_allocation_apply(req: ApiAllocationApplyRequest) -> JSONRespons
     if view is None:
         view = _empty_view(portfolio, "行情缓存尚未就绪，建议稍后再试。")
 
-    from app.rebalance_suggest import compute_contribution_suggestion
-
     prefill_assets = _coerce_prefill_assets(req.prefill_assets)
     prefill_in_view = False
     if prefill_assets:
-        await refresh_runtime_cache(force=True)
+        await _refresh_for_request()
         view = runtime_cache.view or view
         prefill_in_view = True
 
@@ -893,28 +959,18 @@ async def api_v2_allocation_apply(req: ApiAllocationApplyRequest) -> JSONRespons
         prefill_assets=prefill_assets,
         prefill_in_view=prefill_in_view,
     )
-    assets_by_id = {a.id: a for a in portfolio.assets}
+    # Copied only now: the refreshes awaited above may have swapped in a newer portfolio.
+    portfolio = _editable_portfolio()
+    assets_by_id = portfolio.assets_by_id
 
     view_qty_by_id: dict[str, float] = {}
     view_status_by_id: dict[str, str] = {}
-    try:
-        view_assets = []
-        for c in view.categories:
-            view_assets.extend(c.assets)
-        view_assets.extend(view.unassigned)
-        for av in view_assets:
-            try:
-                view_status_by_id[str(av.id)] = str(av.status or "")
-            except Exception:
-                pass
-            if av.quantity is None:
-                continue
-            q = float(av.quantity)
-            if q >= 0 and q < float("inf"):
-                view_qty_by_id[str(av.id)] = q
-    except Exception:
-        view_qty_by_id = {}
-        view_status_by_id = {}
+    for av in view.flat_assets:
+        # AssetView ids come from validated PortfolioAsset ids, already str.
+        view_status_by_id[av.id] = av.status or ""
+        q = av.quantity
+        if q is not None and 0 <= q < math.inf:
+            view_qty_by_id[av.id] = q
 
     applied_cn = 0
     applied_cash = 0
@@ -922,14 +978,20 @@ async def api_v2_allocation_apply(req: ApiAllocationApplyRequest) -> JSONRespons
     applied_crypto_ledger = 0
     skipped = 0
     ledger_new: list[LedgerEntry] = []
-    ledger_ts = float(datetime.now(tz=ZoneInfo(settings.timezone)).timestamp())
+    ledger_ts = float(datetime.now(tz=_tz()).timestamp())
+
+    def _deposit(amount_cny: float, asset_id: str, note: str) -> None:
+        ledger_new.append(
+            LedgerEntry(ts=ledger_ts, direction="deposit", amount_cny=amount_cny, asset_id=asset_id, note=note)
+        )
 
     # Ensure cash bucket has at least one cash asset if cash gets allocated
-    has_cash_asset = any(a.kind == "cash" and (a.category_id or "cash") == "cash" for a in portfolio.assets)
     cash_alloc = next((c.allocate_amount for c in suggestion.categories if c.category_id == "cash"), 0.0)
-    if cash_alloc > 0 and not has_cash_asset:
-        portfolio.assets.append(PortfolioAsset(kind="cash", name="现金", cash_amount_cny=0.0, category_id="cash"))
-        assets_by_id = {a.id: a for a in portfolio.assets}
+    if cash_alloc > 0 and not portfolio.has_cash_asset:
+        cash_asset = PortfolioAsset(kind="cash", name="现金", cash_amount_cny=0.0, category_id="cash")
+        portfolio.assets.append(cash_asset)
+        # The append already invalidated the portfolio's derived maps (keyed on len(assets)); just extend this one.
+        assets_by_id[cash_asset.id] = cash_asset
 
     for cat in suggestion.categories:
         for s in cat.assets:
@@ -944,48 +1006,24 @@ async def api_v2_allocation_apply(req: ApiAllocationApplyRequest) -> JSONRespons
                 if s.est_quantity is None:
                     skipped += 1
                     continue
-                a.quantity = float(a.quantity or 0.0) + float(s.est_quantity)
+                a.quantity += s.est_quantity
                 applied_cn += 1
-                if float(s.amount_cny or 0.0) > 0:
-                    ledger_new.append(
-                        LedgerEntry(
-                            ts=ledger_ts,
-                            direction="deposit",
-                            amount_cny=float(s.amount_cny),
-                            asset_id=a.id,
-                            note="auto: apply allocation",
-                        )
-                    )
+                if s.amount_cny > 0:
+                    _deposit(s.amount_cny, a.id, "auto: apply allocation")
                 continue
             if a.kind == "cash":
-                a.cash_amount_cny = float(a.cash_amount_cny or 0.0) + float(s.amount_cny)
+                a.cash_amount_cny = (a.cash_amount_cny or 0.0) + s.amount_cny
                 applied_cash += 1
-                if float(s.amount_cny or 0.0) > 0:
-                    ledger_new.append(
-                        LedgerEntry(
-                            ts=ledger_ts,
-                            direction="deposit",
-                            amount_cny=float(s.amount_cny),
-                            asset_id=a.id,
-                            note="auto: apply allocation",
-                        )
-                    )
+                if s.amount_cny > 0:
+                    _deposit(s.amount_cny, a.id, "auto: apply allocation")
                 continue
             if a.kind == "crypto":
-                amt = float(s.amount_cny or 0.0)
+                amt = s.amount_cny
                 if s.est_quantity is None:
                     # No price => cannot estimate quantity; keep as "planned" record only.
                     if amt > 0:
                         applied_crypto_ledger += 1
-                        ledger_new.append(
-                            LedgerEntry(
-                                ts=ledger_ts,
-                                direction="deposit",
-                                amount_cny=amt,
-                                asset_id=a.id,
-                                note="auto: apply allocation (crypto planned; missing price)",
-                            )
-                        )
+                        _deposit(amt, a.id, "auto: apply allocation (crypto planned; missing price)")
                     else:
                         skipped += 1
                     continue
@@ -995,18 +1033,10 @@ async def api_v2_allocation_apply(req: ApiAllocationApplyRequest) -> JSONRespons
                     if s.est_quantity is None:
                         skipped += 1
                         continue
-                    a.manual_quantity = float(a.manual_quantity or 0.0) + float(s.est_quantity)
+                    a.manual_quantity += s.est_quantity
                     applied_crypto_manual += 1
                     if amt > 0:
-                        ledger_new.append(
-                            LedgerEntry(
-                                ts=ledger_ts,
-                                direction="deposit",
-                                amount_cny=amt,
-                                asset_id=a.id,
-                                note="auto: apply allocation (crypto manual_quantity)",
-                            )
-                        )
+                        _deposit(amt, a.id, "auto: apply allocation (crypto manual_quantity)")
                     continue
 
                 # Wallet-tracked crypto: to "apply to holdings", switch to manual_quantity using current cached quantity as baseline.
@@ -1016,37 +1046,21 @@ async def api_v2_allocation_apply(req: ApiAllocationApplyRequest) -> JSONRespons
                     # Wallet is readable; do not mutate quantity (wallet-tracked). Record ledger only.
                     if amt > 0:
                         applied_crypto_ledger += 1
-                        ledger_new.append(
-                            LedgerEntry(
-                                ts=ledger_ts,
-                                direction="deposit",
-                                amount_cny=amt,
-                                asset_id=a.id,
-                                note="auto: apply allocation (crypto wallet-tracked)",
-                            )
-                        )
+                        _deposit(amt, a.id, "auto: apply allocation (crypto wallet-tracked)")
                     else:
                         skipped += 1
                     continue
 
                 # Wallet not readable: fall back to manual_quantity so allocation can be applied deterministically.
-                a.manual_quantity = max(0.0, float(base_qty or 0.0)) + float(s.est_quantity)
+                a.manual_quantity = max(0.0, base_qty or 0.0) + s.est_quantity
                 applied_crypto_manual += 1
                 if amt > 0:
-                    ledger_new.append(
-                        LedgerEntry(
-                            ts=ledger_ts,
-                            direction="deposit",
-                            amount_cny=amt,
-                            asset_id=a.id,
-                            note="auto: apply allocation (crypto -> manual_quantity)",
-                        )
-                    )
+                    _deposit(amt, a.id, "auto: apply allocation (crypto -> manual_quantity)")
                 continue
 
             skipped += 1
 
-    save_portfolio(portfolio)
+    _commit_portfolio(portfolio)
     try:
         add_ledger_entries(ledger_new)
     except Exception:
@@ -1063,7 +1077,7 @@ async def api_v2_allocation_apply(req: ApiAllocationApplyRequest) -> JSONRespons
                 "skipped": skipped,
             },
             "ledger_entries": len(ledger_new),
-            "suggestion": asdict(suggestion),
+            "suggestion": suggestion.to_dict(),
         }
     )
 
@@ -1096,79 +1110,208 @@ def _empty_view(portfolio: Portfolio, warning: str) -> PortfolioView:
 
 
 async def refresh_runtime_cache(*, force: bool = False) -> None:
+    global _refresh_done
     if runtime_cache.refresh_running:
+        # A refresh is already fetching: forced callers share its result rather than fanning out again.
+        if force and _refresh_done is not None:
+            await asyncio.shield(_refresh_done)
         return
 
-    if not force and runtime_cache.updated_at is not None:
-        age = (datetime.now() - runtime_cache.updated_at).total_seconds()
-        if age < _CACHE_MIN_REFRESH_GAP_SECONDS:
+    if not force and runtime_cache.updated_mono is not None:
+        age = time.monotonic() - runtime_cache.updated_mono
+        if age < cache_tunables.min_refresh_gap_seconds:
             return
 
     runtime_cache.refresh_running = True
+    done = _refresh_done = asyncio.get_running_loop().create_future()
+    # Anything mutated from here on re-marks the cache dirty for the next cycle.
+    runtime_cache.portfolio_dirty = False
     start = time.perf_counter()
     try:
-        # Reload portfolio only when the file changes (avoid re-parsing on every refresh tick).
-        mtime = PORTFOLIO_PATH.stat().st_mtime if PORTFOLIO_PATH.exists() else None
-        if force or runtime_cache.portfolio is None or runtime_cache.portfolio_mtime != mtime:
-            runtime_cache.portfolio = load_portfolio()
-            runtime_cache.portfolio_mtime = PORTFOLIO_PATH.stat().st_mtime if PORTFOLIO_PATH.exists() else mtime
-
-        portfolio = runtime_cache.portfolio or load_portfolio()
+        # Re-parses portfolio.json only when the file changed; mutation handlers update the cached instance.
+        portfolio = get_portfolio_cached()
+        # One round of concurrent fetches: cn quotes, CoinGecko markets and chain balances are gathered together.
         view = await compute_portfolio_view(portfolio=portfolio, quotes=quotes, chain=chain)
         runtime_cache.view = view
         runtime_cache.updated_at = datetime.now()
+        runtime_cache.updated_mono = time.monotonic()
         runtime_cache.last_error = None
 
         runtime_cache.snapshot_last_epoch = maybe_append_snapshot(
             view=view,
             last_epoch=runtime_cache.snapshot_last_epoch,
-            min_interval_seconds=_CACHE_SNAPSHOT_INTERVAL_SECONDS,
+            min_interval_seconds=cache_tunables.snapshot_interval_seconds,
         )
     except Exception as e:
         runtime_cache.last_error = f"{type(e).__name__}: {e}"
+        runtime_cache.portfolio_dirty = True
     finally:
         runtime_cache.last_duration_ms = (time.perf_counter() - start) * 1000.0
         runtime_cache.refresh_running = False
+        done.set_result(None)
+
+
+async def _refresh_for_request() -> None:
+    # For handlers that want current quotes: skip if the view is younger than the refresh gap,
+    # and let concurrent callers share one in-flight refresh instead of each hitting upstream.
+    global _request_refresh_task
+    updated = runtime_cache.updated_mono
+    if updated is not None and time.monotonic() - updated < cache_tunables.min_refresh_gap_seconds:
+        return
+    if _request_refresh_task is None or _request_refresh_task.done():
+        _request_refresh_task = asyncio.create_task(refresh_runtime_cache(force=True))
+    await asyncio.shield(_request_refresh_task)
 
 
 def trigger_cache_refresh(*, force: bool = False) -> None:
-    asyncio.create_task(refresh_runtime_cache(force=force))
+    global _triggered_refresh_task, _refresh_again
+    if force:
+        # A refresh already in flight ignores this one; keep the change visible to the refresh loop.
+        runtime_cache.portfolio_dirty = True
+    if _triggered_refresh_task is not None and not _triggered_refresh_task.done():
+        # Bursts of mutations fold into one follow-up refresh instead of a task per call.
+        _refresh_again = _refresh_again or force
+        return
+    _triggered_refresh_task = asyncio.create_task(_run_triggered_refresh(force=force))
+
+
+async def _run_triggered_refresh(*, force: bool) -> None:
+    global _refresh_again
+    await refresh_runtime_cache(force=force)
+    while _refresh_again:
+        _refresh_again = False
+        await refresh_runtime_cache(force=True)
+
+
+# Edits arriving within this window after the first one share a single portfolio.json write.
+_PORTFOLIO_SAVE_DELAY_SECONDS = 0.05
+
+
+def _editable_portfolio() -> Portfolio:
+    # Copy on write: a running refresh may still be reading the cached instance across awaits, so handlers edit a
+    # deep copy and _commit_portfolio swaps it in.
+    return get_portfolio_cached().model_copy(deep=True)
+
+
+def _commit_portfolio(portfolio: Portfolio) -> None:
+    # Publish an edited copy from _editable_portfolio() now and write it to disk shortly after.
+    global _portfolio_save_task
+    portfolio.mark_changed()
+    runtime_cache.portfolio = portfolio
+    runtime_cache.portfolio_save_pending = True
+    if _portfolio_save_task is None or _portfolio_save_task.done():
+        _portfolio_save_task = asyncio.create_task(_save_portfolio_later())
+
+
+async def _save_portfolio_later() -> None:
+    await asyncio.sleep(_PORTFOLIO_SAVE_DELAY_SECONDS)
+    await _flush_portfolio()
+
+
+async def _flush_portfolio() -> None:
+    while runtime_cache.portfolio_save_pending and runtime_cache.portfolio is not None:
+        runtime_cache.portfolio_save_pending = False
+        # Dump on the event loop so the worker thread never sees a half-applied edit.
+        data = runtime_cache.portfolio.model_dump()
+        try:
+            await asyncio.to_thread(write_portfolio_dump, data)
+        except Exception as e:
+            runtime_cache.portfolio_save_pending = True
+            runtime_cache.last_error = f"portfolio save failed: {type(e).__name__}: {e}"
+            return
+        runtime_cache.portfolio_mtime = _mtime(PORTFOLIO_PATH)
+
+
+def _portfolio_write_in_flight() -> bool:
+    # While a write is pending the in-memory portfolio is newer than the file; never reload over it.
+    return runtime_cache.portfolio_save_pending or (_portfolio_save_task is not None and not _portfolio_save_task.done())
+
+
+# get_portfolio_cached trusts the cached portfolio for this long before stat()ing the file again.
+_PORTFOLIO_STAT_INTERVAL_SECONDS = 0.5
+_portfolio_checked_at = -math.inf
+
+
+def _mtime(path: Path) -> float | None:
+    try:
+        return path.stat().st_mtime
+    except FileNotFoundError:
+        return None
 
 
 def get_portfolio_cached() -> Portfolio:
     # Keep server-side page renders cheap: avoid re-parsing portfolio.json on every navigation.
-    mtime = PORTFOLIO_PATH.stat().st_mtime if PORTFOLIO_PATH.exists() else None
+    global _portfolio_checked_at
+    if runtime_cache.portfolio is not None and _portfolio_write_in_flight():
+        return runtime_cache.portfolio
+    now = time.monotonic()
+    if runtime_cache.portfolio is not None and now - _portfolio_checked_at < _PORTFOLIO_STAT_INTERVAL_SECONDS:
+        return runtime_cache.portfolio
+    _portfolio_checked_at = now
+    mtime = _mtime(PORTFOLIO_PATH)
     if runtime_cache.portfolio is None or runtime_cache.portfolio_mtime != mtime:
         runtime_cache.portfolio = load_portfolio()
-        runtime_cache.portfolio_mtime = PORTFOLIO_PATH.stat().st_mtime if PORTFOLIO_PATH.exists() else mtime
+        # load_portfolio may (re)write the file (defaults, repairs), so stat again.
+        runtime_cache.portfolio_mtime = _mtime(PORTFOLIO_PATH)
     return runtime_cache.portfolio
 
 
+def _idle_refresh_skippable() -> bool:
+    # While idle, only refetch quotes when something changed or the next history snapshot is due.
+    if runtime_cache.view is None or runtime_cache.portfolio_dirty or runtime_cache.snapshot_last_epoch is None:
+        return False
+    if _mtime(PORTFOLIO_PATH) != runtime_cache.portfolio_mtime:
+        return False
+    return (time.time() - runtime_cache.snapshot_last_epoch) < cache_tunables.snapshot_interval_seconds
+
+
 async def _cache_refresh_loop() -> None:
+    tun = cache_tunables
+    idle = False
     while True:
-        await refresh_runtime_cache(force=False)
-        sleep_s = _CACHE_ACTIVE_REFRESH_INTERVAL_SECONDS
         try:
-            if runtime_cache.last_access_at is None:
-                sleep_s = _CACHE_IDLE_REFRESH_INTERVAL_SECONDS
+            skip = idle and _idle_refresh_skippable()
+        except Exception:
+            skip = False
+        if not skip:
+            await refresh_runtime_cache(force=False)
+        sleep_s = tun.active_refresh_seconds
+        idle = False
+        try:
+            if runtime_cache.last_access_mono is None:
+                sleep_s = tun.idle_refresh_seconds
+                idle = True
             else:
-                idle_s = (datetime.now() - runtime_cache.last_access_at).total_seconds()
-                if idle_s >= _CACHE_IDLE_AFTER_SECONDS:
-                    sleep_s = _CACHE_IDLE_REFRESH_INTERVAL_SECONDS
+                idle_s = time.monotonic() - runtime_cache.last_access_mono
+                if idle_s >= tun.idle_after_seconds:
+                    sleep_s = tun.idle_refresh_seconds
+                    idle = True
         except Exception:
-            sleep_s = _CACHE_ACTIVE_REFRESH_INTERVAL_SECONDS
+            sleep_s = tun.active_refresh_seconds
         await asyncio.sleep(sleep_s)
 
 
+# Encoded GET /api/v2/settings body: (override file key, Settings it was built for, JSON bytes).
+_settings_payload: tuple[tuple | None, Settings, bytes] | None = None
+
+
 @app.get("/api/v2/settings")
 async def api_v2_settings_get() -> JSONResponse:
+    global _settings_payload
+    # Settings are swapped (not mutated) on update, so identity plus the override file key covers every change.
+    file_key = settings_override_key()
+    cached = _settings_payload
+    if cached is not None and cached[0] == file_key and cached[1] is settings:
+        return Response(content=cached[2], media_type="application/json")
     override = load_settings_override() or SettingsOverride()
     payload = {
         "ok": True,
         "override": _sanitize_settings_override_for_ui(override),
         "effective": effective_settings_dict(settings),
     }
-    return JSONResponse(payload)
+    body = orjson.dumps(payload)
+    _settings_payload = (file_key, settings, body)
+    return Response(content=body, media_type="application/json")
 
 
 @app.post("/api/v2/settings")
@@ -1176,8 +1319,6 @@ async def api_v2_settings_update(req: ApiSettingsUpdateRequest) -> JSONResponse:
     global settings
     prev = load_settings_override() or SettingsOverride()
 
-    from app.crypto_store import encrypt_str
-
     def _clean_str(v: str | None) -> str | None:
         if v is None:
             return None
@@ -1251,61 +1392,63 @@ async def api_v2_settings_update(req: ApiSettingsUpdateRequest) -> JSONResponse:
 
 @app.post("/api/v2/settings/test-email")
 async def api_v2_settings_test_email() -> JSONResponse:
-    from zoneinfo import ZoneInfo
-
-    portfolio = load_portfolio()
+    portfolio = get_portfolio_cached()
     view = runtime_cache.view
     if view is None:
         await refresh_runtime_cache(force=True)
         view = runtime_cache.view
     if view is None:
         view = _empty_view(portfolio, "行情缓存尚未就绪，邮件内容可能不完整。")
-    state = load_notification_state()
+    state = await asyncio.to_thread(load_notification_state)
 
-    today = datetime.now(tz=ZoneInfo(settings.timezone)).date()
+    today = datetime.now(tz=_tz()).date()
     first = first_workday_of_month_cn(today)
     yyyymm = today.strftime("%Y-%m")
 
     sent_any = False
+    # Both mails carry the same body; rendered at most once.
+    body: str | None = None
 
     # monthly
     if today == first and state.monthly_last_sent_yyyymm != yyyymm:
-        ok, err = send_email(
+        body = format_email_body(view)
+        ok, err = await asyncio.to_thread(
+            send_email,
             settings=settings,
             subject=f"永久投资组合：{yyyymm} 再平衡检查提醒（手动触发）",
-            body=format_email_body(view),
+            body=body,
         )
         if ok:
             state.monthly_last_sent_yyyymm = yyyymm
             state.last_error = None
-            save_notification_state(state)
             sent_any = True
         else:
             state.last_error = err
-            save_notification_state(state)
+            await asyncio.to_thread(save_notification_state, state)
             return JSONResponse({"ok": False, "error": err or "send failed"}, status_code=500)
 
     # threshold
     if view.rebalance_warnings:
-        payload = "".join([w + "\n" for w in sorted(view.rebalance_warnings)])
-        wh = __import__("hashlib").sha256(payload.encode("utf-8")).hexdigest()
+        wh = warnings_hash(view)
         if should_send_threshold(state=state, warnings_hash=wh, cooldown_minutes=settings.notify_cooldown_minutes):
-            ok, err = send_email(
+            ok, err = await asyncio.to_thread(
+                send_email,
                 settings=settings,
                 subject="永久投资组合：触发再平衡阈值（手动触发）",
-                body=format_email_body(view),
+                body=body if body is not None else format_email_body(view),
             )
             if ok:
-                state.threshold_last_sent_epoch = datetime.now(tz=ZoneInfo(settings.timezone)).timestamp()
+                state.threshold_last_sent_epoch = datetime.now(tz=_tz()).timestamp()
                 state.threshold_last_hash = wh
                 state.last_error = None
-                save_notification_state(state)
                 sent_any = True
             else:
                 state.last_error = err
-                save_notification_state(state)
+                await asyncio.to_thread(save_notification_state, state)
                 return JSONResponse({"ok": False, "error": err or "send failed"}, status_code=500)
 
+    if sent_any:
+        await asyncio.to_thread(save_notification_state, state)
     return JSONResponse({"ok": True, "sent_any": sent_any})
 
 
@@ -1331,5 +1474,10 @@ async def _shutdown() -> None:
         except asyncio.CancelledError:
             pass
         _cache_task = None
+    if _portfolio_save_task is not None:
+        # Let a pending debounced write land, then write anything edited after it started.
+        await _portfolio_save_task
+    await _flush_portfolio()
     await quotes.close()
     await chain.close()
+    close_mailer()
@@ -1,11 +1,13 @@
 from __future__ import annotations
 
-import json
 import time
 from pathlib import Path
 
+import orjson
 from pydantic import BaseModel, Field
 
+from app.fileio import write_bytes_atomic
+
 DATA_DIR = Path(__file__).resolve().parent.parent / "data"
 NOTIFY_PATH = DATA_DIR / "notifications.json"
 
@@ -24,7 +26,7 @@ def load_notification_state() -> NotificationState:
         save_notification_state(st)
         return st
     try:
-        data = json.loads(NOTIFY_PATH.read_text(encoding="utf-8"))
+        data = orjson.loads(NOTIFY_PATH.read_bytes())
         return NotificationState.model_validate(data)
     except Exception:
         st = NotificationState(last_error="failed to parse notifications.json")
@@ -34,10 +36,7 @@ def load_notification_state() -> NotificationState:
 
 def save_notification_state(state: NotificationState) -> None:
     DATA_DIR.mkdir(parents=True, exist_ok=True)
-    NOTIFY_PATH.write_text(
-        json.dumps(state.model_dump(), ensure_ascii=False, indent=2),
-        encoding="utf-8",
-    )
+    write_bytes_atomic(NOTIFY_PATH, orjson.dumps(state.model_dump(), option=orjson.OPT_INDENT_2))
 
 
 def should_send_threshold(*, state: NotificationState, warnings_hash: str, cooldown_minutes: int) -> bool:
@@ -1,11 +1,14 @@
 from __future__ import annotations
 
-import json
+import itertools
 import uuid
 from pathlib import Path
 from typing import Literal
 
-from pydantic import BaseModel, Field, ValidationError
+import orjson
+from pydantic import BaseModel, Field, PrivateAttr, ValidationError
+
+from app.fileio import write_bytes_atomic
 
 DATA_DIR = Path(__file__).resolve().parent.parent / "data"
 PORTFOLIO_PATH = DATA_DIR / "portfolio.json"
@@ -43,11 +46,81 @@ class PortfolioAsset(BaseModel):
     cash_amount_cny: float | None = Field(None, ge=0, description="现金金额（CNY）")
 
 
+_PORTFOLIO_VERSIONS = itertools.count(1)
+
+
 class Portfolio(BaseModel):
     base_currency: str = "CNY"
     categories: list[Category] = Field(default_factory=list)
     assets: list[PortfolioAsset] = Field(default_factory=list)
 
+    # Process-unique version: new for every loaded/constructed object, bumped on save.
+    # Lets callers memoize derived data (e.g. model_dump output) per portfolio state.
+    _version: int = PrivateAttr(default_factory=lambda: next(_PORTFOLIO_VERSIONS))
+    _derived: tuple[tuple[int, int, int, int, int], dict[str, object]] | None = PrivateAttr(default=None)
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def _derived_cache(self) -> dict[str, object]:
+        # Lookup maps are rebuilt when the version bumps or the assets/categories lists are replaced or resized.
+        key = (self._version, id(self.assets), len(self.assets), id(self.categories), len(self.categories))
+        if self._derived is None or self._derived[0] != key:
+            self._derived = (key, {})
+        return self._derived[1]
+
+    @property
+    def assets_by_id(self) -> dict[str, PortfolioAsset]:
+        cache = self._derived_cache()
+        out = cache.get("assets_by_id")
+        if out is None:
+            out = cache["assets_by_id"] = {a.id: a for a in self.assets}
+        return out  # type: ignore[return-value]
+
+    @property
+    def category_name_by_id(self) -> dict[str, str]:
+        cache = self._derived_cache()
+        out = cache.get("category_name_by_id")
+        if out is None:
+            out = cache["category_name_by_id"] = {c.id: c.name for c in self.categories}
+        return out  # type: ignore[return-value]
+
+    @property
+    def asset_category_by_id(self) -> dict[str, str | None]:
+        cache = self._derived_cache()
+        out = cache.get("asset_category_by_id")
+        if out is None:
+            out = cache["asset_category_by_id"] = {
+                a.id: (a.category_id.strip() if a.category_id else None) for a in self.assets
+            }
+        return out  # type: ignore[return-value]
+
+    @property
+    def assets_by_kind(self) -> dict[str, list[PortfolioAsset]]:
+        # Assets partitioned by kind, each list in portfolio order.
+        cache = self._derived_cache()
+        out = cache.get("assets_by_kind")
+        if out is None:
+            out = cache["assets_by_kind"] = {}
+            for a in self.assets:
+                out.setdefault(a.kind, []).append(a)
+        return out  # type: ignore[return-value]
+
+    @property
+    def has_cash_asset(self) -> bool:
+        # Whether the cash bucket holds a manual cash asset (uncategorized cash counts as "cash").
+        cache = self._derived_cache()
+        out = cache.get("has_cash_asset")
+        if out is None:
+            out = cache["has_cash_asset"] = any(
+                a.kind == "cash" and (a.category_id or "cash") == "cash" for a in self.assets
+            )
+        return out  # type: ignore[return-value]
+
+    def mark_changed(self) -> None:
+        self._version = next(_PORTFOLIO_VERSIONS)
+
     @staticmethod
     def default() -> "Portfolio":
         categories = [
@@ -67,42 +140,54 @@ class Portfolio(BaseModel):
         )
 
 
-def normalize_portfolio(portfolio: Portfolio) -> Portfolio:
+def normalize_portfolio(portfolio: Portfolio) -> tuple[Portfolio, bool]:
+    """
+    Fix up fields in place. Returns the portfolio and whether anything actually changed.
+    """
+    changed = False
+
+    def _set(obj: object, name: str, value: object) -> None:
+        nonlocal changed
+        if getattr(obj, name, None) != value:
+            setattr(obj, name, value)
+            changed = True
+
     # Ensure 4 categories exist
     if not portfolio.categories:
         portfolio.categories = Portfolio.default().categories
+        changed = True
 
     cat_ids = {c.id for c in portfolio.categories}
 
     for asset in portfolio.assets:
         if not getattr(asset, "id", None):
-            asset.id = uuid.uuid4().hex
+            _set(asset, "id", uuid.uuid4().hex)
         if not getattr(asset, "kind", None):
-            asset.kind = "crypto" if (asset.wallet or asset.chain or asset.token_address) else "cn"
+            _set(asset, "kind", "crypto" if (asset.wallet or asset.chain or asset.token_address) else "cn")
         if asset.category_id not in cat_ids:
-            asset.category_id = None
+            _set(asset, "category_id", None)
         if asset.kind == "cn" and not asset.code:
-            asset.code = ""
+            _set(asset, "code", "")
         if asset.kind == "crypto":
-            asset.quantity = 0.0
+            _set(asset, "quantity", 0.0)
             if asset.manual_quantity is not None:
                 try:
                     mq = float(asset.manual_quantity)
-                    asset.manual_quantity = mq if mq >= 0 else None
+                    _set(asset, "manual_quantity", mq if mq >= 0 else None)
                 except Exception:
-                    asset.manual_quantity = None
+                    _set(asset, "manual_quantity", None)
         if asset.kind == "cash":
-            asset.code = ""
-            asset.quantity = 0.0
+            _set(asset, "code", "")
+            _set(asset, "quantity", 0.0)
             if asset.cash_amount_cny is None:
-                asset.cash_amount_cny = 0.0
+                _set(asset, "cash_amount_cny", 0.0)
         if getattr(asset, "bucket_weight", None) is not None:
             try:
                 bw = float(asset.bucket_weight)  # type: ignore[arg-type]
-                asset.bucket_weight = bw if bw >= 0 else None
+                _set(asset, "bucket_weight", bw if bw >= 0 else None)
             except Exception:
-                asset.bucket_weight = None
-    return portfolio
+                _set(asset, "bucket_weight", None)
+    return portfolio, changed
 
 
 def _coerce_bucket_weight(value) -> float | None:
@@ -179,9 +264,7 @@ def load_portfolio() -> Portfolio:
         portfolio = Portfolio.default()
         save_portfolio(portfolio)
         return portfolio
-    raw_text = PORTFOLIO_PATH.read_text(encoding="utf-8")
-    original_data = json.loads(raw_text)
-    data = original_data
+    data = orjson.loads(PORTFOLIO_PATH.read_bytes())
     repaired_on_read = False
     try:
         portfolio = Portfolio.model_validate(data)
@@ -191,22 +274,22 @@ def load_portfolio() -> Portfolio:
         portfolio = Portfolio.model_validate(repaired)
         data = repaired
         repaired_on_read = True
-    portfolio = normalize_portfolio(portfolio)
+    portfolio, normalized = normalize_portfolio(portfolio)
 
-    # Avoid rewriting portfolio.json on every read; only persist when repair/normalization changes something.
-    try:
-        normalized = portfolio.model_dump()
-        if repaired_on_read or normalized != original_data:
-            save_portfolio(portfolio)
-    except Exception:
-        # If comparison fails for any reason, fall back to saving the normalized version.
+    # Avoid rewriting portfolio.json on every read; only persist when repair/normalization changed something.
+    if repaired_on_read or normalized:
         save_portfolio(portfolio)
     return portfolio
 
 
 def save_portfolio(portfolio: Portfolio) -> None:
+    portfolio.mark_changed()
+    write_portfolio_dump(portfolio.model_dump())
+
+
+def write_portfolio_dump(data: dict) -> None:
+    """
+    Write an already dumped portfolio. Safe to call from a worker thread.
+    """
     DATA_DIR.mkdir(parents=True, exist_ok=True)
-    PORTFOLIO_PATH.write_text(
-        json.dumps(portfolio.model_dump(), ensure_ascii=False, indent=2),
-        encoding="utf-8",
-    )
+    write_bytes_atomic(PORTFOLIO_PATH, orjson.dumps(data, option=orjson.OPT_INDENT_2))
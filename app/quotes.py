@@ -1,16 +1,25 @@
 from __future__ import annotations
 
 import asyncio
-import json
 import re
 import time
-from dataclasses import dataclass
-from typing import Any
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Awaitable, Callable
 
 import httpx
+import orjson
 
+from app.fileio import write_bytes_atomic
+from app.lru import LRUCache
 
-@dataclass(frozen=True)
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+QUOTE_CACHE_PATH = DATA_DIR / "quote_cache.json"
+
+
+@dataclass(frozen=True, slots=True)
 class Quote:
     code: str
     name: str
@@ -21,18 +30,35 @@ class Quote:
     raw: dict[str, Any] | None = None
 
 
-@dataclass(frozen=True)
+_CN_PREFIXED_RE = re.compile(r"(sh|sz|bj)\d{6}")
+_CN_CODE6_RE = re.compile(r"\d{6}")
+_FUNDGZ_RE = re.compile(r"jsonpgz\((\{.*\})\);?")
+_TENCENT_QT_RE = re.compile(r'v_\w+=\"(.*)\";')
+# Bulk responses: one v_<symbol>="<fields>"; per symbol, matched on the raw body bytes.
+_TENCENT_BULK_RE = re.compile(rb'v_(\w+)="([^"]*)";')
+
+_COINGECKO_PAGE_SIZE = 250
+_COINGECKO_MAX_RETRIES = 2
+_COINGECKO_BACKOFF_SECONDS = 1.0
+
+
+@dataclass(frozen=True, slots=True)
 class _CacheEntry:
     ts: float
     ttl: float
     quote: Quote
+    # Past ts+ttl (and within stale_ttl) the quote is still served while a background refresh runs.
+    stale_ttl: float = 0.0
 
 
 class QuoteProvider:
-    def __init__(self) -> None:
+    def __init__(self, *, max_entries: int = 2048) -> None:
+        # Keep idle connections for 30s (httpx defaults to 5s) so the 4s realtime polls and 45s fund/CoinGecko
+        # refreshes reuse them instead of re-handshaking; HTTP/2 multiplexes concurrent fetches per host.
         self._client = httpx.AsyncClient(
-            timeout=httpx.Timeout(8.0),
-            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+            http2=True,
+            timeout=httpx.Timeout(8.0, connect=3.0),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=40, keepalive_expiry=30.0),
             headers={
                 "User-Agent": (
                     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
@@ -41,117 +67,284 @@ class QuoteProvider:
                 )
             },
         )
-        self._lock = asyncio.Lock()
-        self._cache: dict[str, _CacheEntry] = {}
-        self._cg_cache: dict[str, _CacheEntry] = {}
+        # Read and written without awaiting in between, so no lock is needed. Bounded so typos and
+        # one-off lookups (including short-lived error entries) do not accumulate forever; TTLs handle freshness.
+        self._cache: LRUCache[str, _CacheEntry] = LRUCache(max_entries)
+        self._cg_cache: LRUCache[str, _CacheEntry] = LRUCache(max_entries)
+        # Key -> task fetching it (one task may cover many keys). Concurrent misses and stale
+        # revalidations for the same key share that task instead of hitting upstream again.
+        self._inflight: dict[str, asyncio.Task[dict[str, Quote]]] = {}
+        self._cg_inflight: dict[str, asyncio.Task[dict[str, Quote]]] = {}
+        # CoinGecko bulk chunk (its ids param) -> (ETag, quotes parsed from that response), replayed
+        # as If-None-Match so an unchanged chunk comes back as a bodiless 304.
+        self._cg_etags: LRUCache[str, tuple[str, dict[str, Quote]]] = LRUCache(64)
 
         # TTLs (seconds): keep requests off the critical path; background refresh reads cache.
         self.cn_realtime_ttl_seconds = 4.0  # A股/ETF (Tencent)
         self.cn_fund_ttl_seconds = 45.0  # 基金口径（净值/估值）
         self.coingecko_ttl_seconds = 45.0
+        # lsjz is the published daily NAV (updated once per evening), not an intraday estimate.
+        self.cn_nav_ttl_seconds = 30 * 60.0
         self.error_ttl_seconds = 10.0
+        # Malformed codes can never resolve; remember them longer than transient failures.
+        self.invalid_code_ttl_seconds = 300.0
+
+        # Stale-while-revalidate windows (seconds past the TTL). Realtime prices lag at most one more
+        # TTL; slow-moving fund NAVs and CoinGecko markets get a generous window. Errors are never served stale.
+        self.cn_realtime_stale_seconds = self.cn_realtime_ttl_seconds
+        self.cn_fund_stale_seconds = 5 * self.cn_fund_ttl_seconds
+        self.coingecko_stale_seconds = 5 * self.coingecko_ttl_seconds
+        self.cn_nav_stale_seconds = 2 * self.cn_nav_ttl_seconds
+
+        # (ttl, stale_ttl) per source, built from the tunables above. This module's source literals are
+        # listed so the usual case is one lookup; other sources fall back to their provider prefix,
+        # then to the fund policy.
+        self._default_ttls = (self.cn_fund_ttl_seconds, self.cn_fund_stale_seconds)
+        realtime = (self.cn_realtime_ttl_seconds, self.cn_realtime_stale_seconds)
+        coingecko = (self.coingecko_ttl_seconds, self.coingecko_stale_seconds)
+        self._ttls_by_source = {
+            "tencent-qt": realtime,
+            "eastmoney-fundgz": self._default_ttls,
+            "eastmoney-lsjz": (self.cn_nav_ttl_seconds, self.cn_nav_stale_seconds),
+            "coingecko": coingecko,
+            "tencent": realtime,
+            "eastmoney": self._default_ttls,
+        }
+
+        # Quotes that are still servable (fresh or stale) are persisted, so a restart starts warm
+        # instead of refetching every code at once.
+        self.cache_flush_interval_seconds = 30.0
+        self._cache_dirty = False
+        self._cache_flushed_at = time.monotonic()
+        self._flush_task: asyncio.Task[None] | None = None
+        self._load_cache_from_disk()
 
     async def close(self) -> None:
+        for task in {*self._inflight.values(), *self._cg_inflight.values()}:
+            task.cancel()
+        if self._flush_task is not None:
+            await self._flush_task
+        self.flush_cache()
         await self._client.aclose()
 
-    def _ttl_for_quote(self, q: Quote) -> float:
-        src = (q.source or "").lower()
-        if src.endswith("invalid") or src == "unavailable":
-            return self.error_ttl_seconds
-        if q.price is None and q.change_pct is None:
-            return self.error_ttl_seconds
-        if src.startswith("tencent"):
-            return self.cn_realtime_ttl_seconds
-        if src.startswith("eastmoney"):
-            return self.cn_fund_ttl_seconds
-        if src.startswith("coingecko"):
-            return self.coingecko_ttl_seconds
-        return self.cn_fund_ttl_seconds
+    def _load_cache_from_disk(self) -> None:
+        try:
+            data = orjson.loads(QUOTE_CACHE_PATH.read_bytes())
+        except Exception:
+            return
+        if not isinstance(data, dict):
+            return
+        now = time.monotonic()
+        # Entries are stored with wall-clock timestamps; map them back onto this process's monotonic clock.
+        offset = time.time() - now
+        for name, cache in (("cn", self._cache), ("cg", self._cg_cache)):
+            entries = data.get(name)
+            if not isinstance(entries, dict):
+                continue
+            for key, it in entries.items():
+                try:
+                    entry = _CacheEntry(
+                        ts=float(it["ts"]) - offset,
+                        ttl=float(it["ttl"]),
+                        quote=Quote(**it["quote"]),
+                        stale_ttl=float(it["stale_ttl"]),
+                    )
+                except Exception:
+                    continue
+                if now - entry.ts < entry.ttl + entry.stale_ttl:
+                    cache[key] = entry
+
+    def _dump_cache(self) -> bytes:
+        now = time.monotonic()
+        offset = time.time() - now
+        out: dict[str, dict[str, Any]] = {}
+        for name, cache in (("cn", self._cache), ("cg", self._cg_cache)):
+            # Errors are never served stale, so only entries with a stale window are worth keeping.
+            out[name] = {
+                key: {"ts": e.ts + offset, "ttl": e.ttl, "stale_ttl": e.stale_ttl, "quote": asdict(e.quote)}
+                for key, e in cache.items()
+                if e.stale_ttl > 0 and now - e.ts < e.ttl + e.stale_ttl
+            }
+        return orjson.dumps(out)
+
+    def flush_cache(self) -> None:
+        """Write servable quotes to QUOTE_CACHE_PATH (no-op when nothing changed)."""
+        if not self._cache_dirty:
+            return
+        self._cache_dirty = False
+        self._cache_flushed_at = time.monotonic()
+        _write_quote_cache(self._dump_cache())
+
+    def _mark_cache_dirty(self) -> None:
+        # After cache writes: flush at most once per interval, with the file write off the event loop.
+        self._cache_dirty = True
+        if self._flush_task is not None and not self._flush_task.done():
+            return
+        if (time.monotonic() - self._cache_flushed_at) < self.cache_flush_interval_seconds:
+            return
+        self._cache_dirty = False
+        self._cache_flushed_at = time.monotonic()
+        self._flush_task = asyncio.create_task(asyncio.to_thread(_write_quote_cache, self._dump_cache()))
+
+    def _ttls_for_quote(self, q: Quote) -> tuple[float, float]:
+        # (ttl, stale_ttl). Sources are this module's lowercase literals: "<provider>-<endpoint>" or "<provider>".
+        src = q.source or ""
+        if src == "invalid":
+            return self.invalid_code_ttl_seconds, 0.0
+        if src.endswith("invalid") or src == "unavailable" or (q.price is None and q.change_pct is None):
+            return self.error_ttl_seconds, 0.0
+        ttls = self._ttls_by_source.get(src)
+        if ttls is None:
+            ttls = self._ttls_by_source.get(src.split("-", 1)[0], self._default_ttls)
+        return ttls
+
+    def _entry(self, q: Quote, now: float) -> _CacheEntry:
+        ttl, stale_ttl = self._ttls_for_quote(q)
+        return _CacheEntry(ts=now, ttl=ttl, quote=q, stale_ttl=stale_ttl)
+
+    def _lookup(
+        self,
+        cache: LRUCache[str, _CacheEntry],
+        keys: list[str],
+        now: float,
+    ) -> tuple[dict[str, Quote], list[str], list[str]]:
+        # Split keys into (usable quotes, stale keys to revalidate, keys that must be fetched).
+        out: dict[str, Quote] = {}
+        stale: list[str] = []
+        missing: list[str] = []
+        for key in keys:
+            cached = cache.get(key)
+            if cached is None:
+                missing.append(key)
+                continue
+            age = now - cached.ts
+            if age < cached.ttl + cached.stale_ttl:
+                out[key] = cached.quote
+                if age >= cached.ttl:
+                    stale.append(key)
+            else:
+                missing.append(key)
+        return out, stale, missing
+
+    def _start_fetch(
+        self,
+        keys: list[str],
+        inflight: dict[str, asyncio.Task[dict[str, Quote]]],
+        fetch: Callable[..., Awaitable[dict[str, Quote]]],
+    ) -> None:
+        # One task for every key not already being fetched; each key points at the task that covers it.
+        keys = [k for k in dict.fromkeys(keys) if k not in inflight]
+        if not keys:
+            return
+        task = asyncio.create_task(fetch(keys, now=time.monotonic()))
+        for k in keys:
+            inflight[k] = task
+
+        def _done(t: asyncio.Task) -> None:
+            for k in keys:
+                if inflight.get(k) is t:
+                    del inflight[k]
+            if not t.cancelled():
+                t.exception()  # background revalidations may have no waiter to retrieve a failure
+
+        task.add_done_callback(_done)
+
+    async def _await_fetch(
+        self,
+        keys: list[str],
+        inflight: dict[str, asyncio.Task[dict[str, Quote]]],
+        fetch: Callable[..., Awaitable[dict[str, Quote]]],
+    ) -> dict[str, Quote]:
+        self._start_fetch(keys, inflight, fetch)
+        tasks = {id(t): t for t in (inflight.get(k) for k in keys) if t is not None}
+        # Shielded: a cancelled caller must not cancel a fetch other callers are waiting on.
+        results = await asyncio.gather(*[asyncio.shield(t) for t in tasks.values()], return_exceptions=True)
+        merged: dict[str, Quote] = {}
+        for r in results:
+            if isinstance(r, dict):
+                merged.update(r)
+        return {k: merged[k] for k in keys if k in merged}
 
     async def get_quote(self, code: str) -> Quote:
         code = code.strip()
         if not code:
             return Quote(code=code, name="", price=None, change_pct=None, as_of=None, source="invalid")
 
-        now = time.time()
-        async with self._lock:
-            cached = self._cache.get(code)
-            if cached and (now - cached.ts) < cached.ttl:
-                return cached.quote
-
-        quote = await self._fetch_quote(code)
-        ttl = self._ttl_for_quote(quote)
-        async with self._lock:
-            self._cache[code] = _CacheEntry(ts=now, ttl=ttl, quote=quote)
-        return quote
+        out, stale, missing = self._lookup(self._cache, [code], time.monotonic())
+        if stale:
+            self._start_fetch(stale, self._inflight, self._fetch_quotes_many)
+        if missing:
+            out = await self._await_fetch(missing, self._inflight, self._fetch_quotes_many)
+        return out.get(code) or Quote(code=code, name="", price=None, change_pct=None, as_of=None, source="unavailable")
 
     async def get_coingecko_market(self, coingecko_id: str) -> Quote:
         coingecko_id = (coingecko_id or "").strip().lower()
         if not coingecko_id:
             return Quote(code=coingecko_id, name="", price=None, change_pct=None, as_of=None, source="coingecko-invalid")
 
-        now = time.time()
-        async with self._lock:
-            cached = self._cg_cache.get(coingecko_id)
-            if cached and (now - cached.ts) < cached.ttl:
-                return cached.quote
-
-        q = await _fetch_coingecko_market(self._client, coingecko_id)
-        async with self._lock:
-            self._cg_cache[coingecko_id] = _CacheEntry(ts=now, ttl=self._ttl_for_quote(q), quote=q)
-        return q
+        out, stale, missing = self._lookup(self._cg_cache, [coingecko_id], time.monotonic())
+        if stale:
+            self._start_fetch(stale, self._cg_inflight, self._fetch_coingecko_each)
+        if missing:
+            out = await self._await_fetch(missing, self._cg_inflight, self._fetch_coingecko_each)
+        return out.get(coingecko_id) or Quote(
+            code=coingecko_id, name="", price=None, change_pct=None, as_of=None, source="coingecko"
+        )
 
     async def get_coingecko_markets_bulk(self, ids: list[str]) -> dict[str, Quote]:
         cleaned = [i.strip().lower() for i in ids if i and i.strip()]
         if not cleaned:
             return {}
 
-        now = time.time()
-        out: dict[str, Quote] = {}
-        missing: list[str] = []
-        async with self._lock:
-            for cid in cleaned:
-                cached = self._cg_cache.get(cid)
-                if cached and (now - cached.ts) < cached.ttl:
-                    out[cid] = cached.quote
-                else:
-                    missing.append(cid)
-
-        # CoinGecko supports comma-separated ids
+        out, stale, missing = self._lookup(self._cg_cache, cleaned, time.monotonic())
+        if stale:
+            self._start_fetch(stale, self._cg_inflight, self._fetch_coingecko_many)
         if missing:
-            fetched = await _fetch_coingecko_markets_bulk(self._client, missing)
-            async with self._lock:
-                for cid, q in fetched.items():
-                    self._cg_cache[cid] = _CacheEntry(ts=now, ttl=self._ttl_for_quote(q), quote=q)
-            out.update(fetched)
+            out.update(await self._await_fetch(missing, self._cg_inflight, self._fetch_coingecko_many))
 
         # Ensure all requested keys exist
         for cid in cleaned:
             out.setdefault(cid, Quote(code=cid, name="", price=None, change_pct=None, as_of=None, source="coingecko"))
         return out
 
+    async def _fetch_coingecko_many(self, ids: list[str], *, now: float) -> dict[str, Quote]:
+        # CoinGecko supports comma-separated ids
+        fetched = await _fetch_coingecko_markets_bulk(self._client, ids, etags=self._cg_etags)
+        for cid, q in fetched.items():
+            self._cg_cache[cid] = self._entry(q, now)
+        self._mark_cache_dirty()
+        return fetched
+
+    async def _fetch_coingecko_each(self, ids: list[str], *, now: float) -> dict[str, Quote]:
+        quotes = await asyncio.gather(*[_fetch_coingecko_market(self._client, cid) for cid in ids])
+        fetched = dict(zip(ids, quotes))
+        for cid, q in fetched.items():
+            self._cg_cache[cid] = self._entry(q, now)
+        self._mark_cache_dirty()
+        return fetched
+
     async def get_quotes_bulk(self, codes: list[str]) -> dict[str, Quote]:
         cleaned = [c.strip() for c in codes if c and c.strip()]
         if not cleaned:
             return {}
-        now = time.time()
 
-        out: dict[str, Quote] = {}
-        missing: list[str] = []
-        async with self._lock:
-            for code in cleaned:
-                cached = self._cache.get(code)
-                if cached and (now - cached.ts) < cached.ttl:
-                    out[code] = cached.quote
-                else:
-                    missing.append(code)
+        out, stale, missing = self._lookup(self._cache, cleaned, time.monotonic())
+        if stale:
+            self._start_fetch(stale, self._inflight, self._fetch_cn_many)
+        if missing:
+            out.update(await self._await_fetch(missing, self._inflight, self._fetch_cn_many))
 
+        for code in cleaned:
+            out.setdefault(code, Quote(code=code, name="", price=None, change_pct=None, as_of=None, source="unavailable"))
+        return out
+
+    async def _fetch_cn_many(self, codes: list[str], *, now: float) -> dict[str, Quote]:
         # Bulk fetch Tencent for those supported
         sym_map: dict[str, str] = {}
         others: list[str] = []
-        for code in missing:
+        for code in codes:
             normalized = code.strip().lower()
-            if re.fullmatch(r"(sh|sz|bj)\d{6}", normalized):
+            if _CN_PREFIXED_RE.fullmatch(normalized):
                 sym_map[normalized] = code
                 continue
             sym = _tencent_symbol(code)
@@ -160,57 +353,67 @@ class QuoteProvider:
             else:
                 others.append(code)
 
-        if sym_map:
-            fetched_cn = await _fetch_tencent_cn_quotes_bulk(self._client, sym_map)
-            out.update(fetched_cn)
-            async with self._lock:
-                for code, q in fetched_cn.items():
-                    self._cache[code] = _CacheEntry(ts=now, ttl=self._ttl_for_quote(q), quote=q)
-
-        # Fallback for remaining codes (fund endpoints, etc.)
-        for code in others:
-            q = await self._fetch_quote(code)
-            out[code] = q
-            async with self._lock:
-                self._cache[code] = _CacheEntry(ts=now, ttl=self._ttl_for_quote(q), quote=q)
+        # Codes without a Tencent symbol (fund endpoints, etc.) are fetched alongside the bulk request.
+        bulk_task = _fetch_tencent_cn_quotes_bulk(self._client, sym_map) if sym_map else asyncio.sleep(0, result={})
+        fetched_cn, out = await asyncio.gather(bulk_task, self._fetch_quotes_many(others, now=now))
+        out.update(fetched_cn)
+        for code, q in fetched_cn.items():
+            self._cache[code] = self._entry(q, now)
+        if fetched_cn:
+            self._mark_cache_dirty()
 
         # If Tencent bulk didn't return (or returned without price), fallback to _fetch_quote
-        tencent_missed = [code for code in missing if code not in out or out[code].price is None]
-        for code in tencent_missed:
-            q = await self._fetch_quote(code)
-            out[code] = q
-            async with self._lock:
-                self._cache[code] = _CacheEntry(ts=now, ttl=self._ttl_for_quote(q), quote=q)
-
-        for code in cleaned:
-            out.setdefault(code, Quote(code=code, name="", price=None, change_pct=None, as_of=None, source="unavailable"))
+        tencent_missed = [code for code in sym_map.values() if code not in out or out[code].price is None]
+        out.update(await self._fetch_quotes_many(tencent_missed, now=now))
         return out
 
+    async def _fetch_quotes_many(self, codes: list[str], *, now: float) -> dict[str, Quote]:
+        # Per-code fallbacks run concurrently; the client's connection limit bounds the fan-out.
+        if not codes:
+            return {}
+        quotes = await asyncio.gather(*[self._fetch_quote(code) for code in codes])
+        fetched = dict(zip(codes, quotes))
+        for code, q in fetched.items():
+            self._cache[code] = self._entry(q, now)
+        self._mark_cache_dirty()
+        return fetched
+
     async def _fetch_quote(self, code: str) -> Quote:
         normalized = code.strip().lower()
         # 如果用户显式带市场前缀（sh/sz/bj），强制按交易所标的处理，避免“000001”这类冲突代码误判成基金。
-        if re.fullmatch(r"(sh|sz|bj)\d{6}", normalized):
+        if _CN_PREFIXED_RE.fullmatch(normalized):
             q = await _fetch_tencent_cn_quote(self._client, normalized)
             if q:
                 return q
             return Quote(code=code, name="", price=None, change_pct=None, as_of=None, source="unavailable")
 
         # 6 位数字（无前缀）：优先按交易所行情（ETF/股票更贴近“你看到的实时价格”），失败再按基金口径
-        if re.fullmatch(r"\d{6}", code):
-            q = await _fetch_tencent_cn_quote(self._client, code)
-            if q and q.price is not None:
-                return q
-            q = await _fetch_eastmoney_fund_estimate(self._client, code)
-            if q:
-                return q
+        # Tencent and the fund estimate are requested together so fund codes do not wait out a failed Tencent
+        # lookup first; the Tencent price still wins when it has one.
+        if _CN_CODE6_RE.fullmatch(code):
+            tq, fq = await asyncio.gather(
+                _fetch_tencent_cn_quote(self._client, code),
+                _fetch_eastmoney_fund_estimate(self._client, code),
+            )
+            if tq and tq.price is not None:
+                return tq
+            if fq:
+                return fq
             q = await _fetch_eastmoney_fund_nav_lsjz(self._client, code)
             if q:
                 return q
+            return Quote(code=code, name="", price=None, change_pct=None, as_of=None, source="unavailable")
 
-        q = await _fetch_tencent_cn_quote(self._client, code)
-        if q and q.price is not None:
-            return q
-        return Quote(code=code, name="", price=None, change_pct=None, as_of=None, source="unavailable")
+        # Neither an exchange-prefixed code nor 6 digits: no upstream can resolve it, so skip the HTTP round trip.
+        return Quote(code=code, name="", price=None, change_pct=None, as_of=None, source="invalid")
+
+
+def _write_quote_cache(data: bytes) -> None:
+    try:
+        DATA_DIR.mkdir(parents=True, exist_ok=True)
+        write_bytes_atomic(QUOTE_CACHE_PATH, data)
+    except OSError:
+        pass  # a missed flush only makes the next start colder
 
 
 async def _fetch_eastmoney_fund_estimate(client: httpx.AsyncClient, code: str) -> Quote | None:
@@ -225,11 +428,13 @@ async def _fetch_eastmoney_fund_estimate(client: httpx.AsyncClient, code: str) -
         return None
 
 
+# Pure, and sees the same few dozen codes on every refresh tick.
+@lru_cache(maxsize=4096)
 def _tencent_symbol(code: str) -> str | None:
     code = code.strip().lower()
-    if re.fullmatch(r"(sh|sz|bj)\d{6}", code):
+    if _CN_PREFIXED_RE.fullmatch(code):
         return code
-    if not re.fullmatch(r"\d{6}", code):
+    if not _CN_CODE6_RE.fullmatch(code):
         return None
     # 上交所：A 股 6xxxxx；ETF/基金 5xxxxx
     if code.startswith(("6", "5")):
@@ -261,12 +466,12 @@ async def _fetch_tencent_cn_quote(client: httpx.AsyncClient, code: str) -> Quote
 
 def _parse_eastmoney_fundgz(text: str, code: str) -> Quote | None:
     text = text.strip()
-    m = re.search(r"jsonpgz\((\{.*\})\);?", text)
+    m = _FUNDGZ_RE.search(text)
     if not m:
         return None
     raw_json = m.group(1)
     try:
-        data = json.loads(raw_json)
+        data = orjson.loads(raw_json)
     except Exception:
         return None
     name = str(data.get("name") or "")
@@ -298,7 +503,7 @@ async def _fetch_eastmoney_fund_nav_lsjz(client: httpx.AsyncClient, code: str) -
         )
         if r.status_code != 200:
             return None
-        data = r.json()
+        data = orjson.loads(r.content)
         err_code = data.get("ErrCode") or data.get("ErrCod")
         if err_code not in (0, "0", None):
             return None
@@ -327,16 +532,21 @@ async def _fetch_eastmoney_fund_nav_lsjz(client: httpx.AsyncClient, code: str) -
 
 
 def _parse_tencent_qt(text: str, requested_code: str) -> Quote | None:
-    m = re.search(r'v_\w+=\"(.*)\";', text)
+    m = _TENCENT_QT_RE.search(text)
     if not m:
         return None
-    parts = m.group(1).split("~")
+    return _parse_tencent_fields(m.group(1), requested_code)
+
+
+def _parse_tencent_fields(fields: str, requested_code: str) -> Quote | None:
+    # ~88 fields per symbol; only indexes up to 32 are read, so leave the tail unsplit.
+    parts = fields.split("~", 33)
     if len(parts) < 6:
         return None
     name = parts[1]
-    price = _to_float(parts[3])
-    prev_close = _to_float(parts[4])
-    change_pct = _to_float(parts[32]) if len(parts) > 32 else None
+    price = _field_float(parts[3])
+    prev_close = _field_float(parts[4])
+    change_pct = _field_float(parts[32]) if len(parts) > 32 else None
     if change_pct is None and price is not None and prev_close not in (None, 0):
         change_pct = (price / prev_close - 1.0) * 100.0
     as_of = parts[30] if len(parts) > 30 and parts[30] else None
@@ -350,14 +560,29 @@ def _parse_tencent_qt(text: str, requested_code: str) -> Quote | None:
     )
 
 
+def _field_float(s: str) -> float | None:
+    # _to_float for fields of an already-split payload: no str()/strip(); NaN still maps to None.
+    if not s:
+        return None
+    try:
+        v = float(s)
+    except ValueError:
+        return None
+    return None if v != v else v
+
+
 def _to_float(value: Any) -> float | None:
+    # JSON numbers (CoinGecko, lsjz) arrive as float/int: skip the str() round trip for them.
+    if type(value) is float:
+        return None if value != value else value
+    if type(value) is int:
+        return float(value)
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return _field_float(value)
     try:
-        if value is None:
-            return None
-        s = str(value).strip()
-        if s == "" or s.lower() == "nan":
-            return None
-        return float(s)
+        return _field_float(str(value))
     except Exception:
         return None
 
@@ -376,7 +601,7 @@ async def _fetch_coingecko_market(client: httpx.AsyncClient, coingecko_id: str)
         )
         if r.status_code != 200:
             return Quote(code=coingecko_id, name="", price=None, change_pct=None, as_of=None, source="coingecko")
-        data = r.json()
+        data = orjson.loads(r.content)
         if not isinstance(data, list) or not data:
             return Quote(code=coingecko_id, name="", price=None, change_pct=None, as_of=None, source="coingecko")
         it = data[0]
@@ -388,83 +613,90 @@ async def _fetch_coingecko_market(client: httpx.AsyncClient, coingecko_id: str)
         return Quote(code=coingecko_id, name="", price=None, change_pct=None, as_of=None, source="coingecko")
 
 
-async def _fetch_coingecko_markets_bulk(client: httpx.AsyncClient, ids: list[str]) -> dict[str, Quote]:
-    out: dict[str, Quote] = {}
-    # keep request size sane
-    chunks: list[list[str]] = []
-    chunk: list[str] = []
-    for cid in ids:
-        chunk.append(cid)
-        if len(chunk) >= 120:
-            chunks.append(chunk)
-            chunk = []
-    if chunk:
-        chunks.append(chunk)
-
-    for ch in chunks:
+async def _fetch_coingecko_markets_bulk(
+    client: httpx.AsyncClient,
+    ids: list[str],
+    *,
+    etags: LRUCache[str, tuple[str, dict[str, Quote]]] | None = None,
+) -> dict[str, Quote]:
+    # /coins/markets pages results (default 100 per page, max 250): one full page per chunk.
+    chunks = [ids[i : i + _COINGECKO_PAGE_SIZE] for i in range(0, len(ids), _COINGECKO_PAGE_SIZE)]
+    # Chunks run concurrently, but the free tier is rate-limited: at most two in flight, backing off on 429.
+    sem = asyncio.Semaphore(2)
+
+    async def _fetch_chunk(ch: list[str]) -> dict[str, Quote]:
         url = "https://api.coingecko.com/api/v3/coins/markets"
-        try:
-            r = await client.get(
-                url,
-                params={
-                    "vs_currency": "cny",
-                    "ids": ",".join(ch),
-                    "price_change_percentage": "24h",
-                },
-            )
-            if r.status_code != 200:
-                continue
-            data = r.json()
-            if not isinstance(data, list):
+        params = {
+            "vs_currency": "cny",
+            "ids": ",".join(ch),
+            "per_page": str(_COINGECKO_PAGE_SIZE),
+            "price_change_percentage": "24h",
+        }
+        validator = etags.get(params["ids"]) if etags is not None else None
+        headers = {"If-None-Match": validator[0]} if validator else None
+        async with sem:
+            for attempt in range(_COINGECKO_MAX_RETRIES + 1):
+                r = await client.get(url, params=params, headers=headers)
+                if r.status_code != 429 or attempt == _COINGECKO_MAX_RETRIES:
+                    break
+                await asyncio.sleep(_COINGECKO_BACKOFF_SECONDS * 2**attempt)
+        if r.status_code == 304 and validator:
+            return validator[1]
+        if r.status_code != 200:
+            return {}
+        data = orjson.loads(r.content)
+        if not isinstance(data, list):
+            return {}
+        out: dict[str, Quote] = {}
+        for it in data:
+            cid = str(it.get("id") or "").strip().lower()
+            if not cid:
                 continue
-            for it in data:
-                cid = str(it.get("id") or "").strip().lower()
-                if not cid:
-                    continue
-                out[cid] = Quote(
-                    code=cid,
-                    name=str(it.get("name") or ""),
-                    price=_to_float(it.get("current_price")),
-                    change_pct=_to_float(it.get("price_change_percentage_24h")),
-                    as_of=None,
-                    source="coingecko",
-                    raw={"coingecko": it},
-                )
-        except Exception:
-            continue
+            out[cid] = Quote(
+                code=cid,
+                name=str(it.get("name") or ""),
+                price=_to_float(it.get("current_price")),
+                change_pct=_to_float(it.get("price_change_percentage_24h")),
+                as_of=None,
+                source="coingecko",
+                raw={"coingecko": it},
+            )
+        etag = r.headers.get("etag")
+        if etags is not None and etag:
+            etags[params["ids"]] = (etag, out)
+        return out
+
+    return _merge_chunks(await asyncio.gather(*[_fetch_chunk(ch) for ch in chunks], return_exceptions=True))
+
+
+def _merge_chunks(results: list[dict[str, Quote] | BaseException]) -> dict[str, Quote]:
+    # A failed chunk only loses its own symbols.
+    out: dict[str, Quote] = {}
+    for r in results:
+        if isinstance(r, dict):
+            out.update(r)
     return out
 
 
 async def _fetch_tencent_cn_quotes_bulk(client: httpx.AsyncClient, sym_to_requested: dict[str, str]) -> dict[str, Quote]:
     syms = list(sym_to_requested.keys())
-    out: dict[str, Quote] = {}
+    chunks = [syms[i : i + 60] for i in range(0, len(syms), 60)]
 
-    chunks: list[list[str]] = []
-    chunk: list[str] = []
-    for s in syms:
-        chunk.append(s)
-        if len(chunk) >= 60:
-            chunks.append(chunk)
-            chunk = []
-    if chunk:
-        chunks.append(chunk)
-
-    for ch in chunks:
-        url = f"https://qt.gtimg.cn/q={','.join(ch)}"
-        try:
-            r = await client.get(url)
-            if r.status_code != 200:
+    async def _fetch_chunk(ch: list[str]) -> dict[str, Quote]:
+        r = await client.get(f"https://qt.gtimg.cn/q={','.join(ch)}")
+        if r.status_code != 200:
+            return {}
+        out: dict[str, Quote] = {}
+        # Same charset r.text would use (Tencent declares GBK); only the payloads of requested symbols are decoded.
+        # Matching on bytes is safe ('"' is never a GBK trail byte), but '~' is, so decode before splitting.
+        encoding = r.encoding or "gbk"
+        for m in _TENCENT_BULK_RE.finditer(r.content):
+            requested = sym_to_requested.get(m.group(1).decode("ascii"))
+            if not requested:
                 continue
-            for m in re.finditer(r'(v_\w+=\"[^\"]*\");', r.text):
-                line = m.group(0)
-                var = line.split("=", 1)[0].strip()
-                sym = var.replace("v_", "", 1)
-                requested = sym_to_requested.get(sym)
-                if not requested:
-                    continue
-                q = _parse_tencent_qt(text=line, requested_code=requested)
-                if q:
-                    out[requested] = q
-        except Exception:
-            continue
-    return out
+            q = _parse_tencent_fields(m.group(2).decode(encoding, "replace"), requested)
+            if q:
+                out[requested] = q
+        return out
+
+    return _merge_chunks(await asyncio.gather(*[_fetch_chunk(ch) for ch in chunks], return_exceptions=True))
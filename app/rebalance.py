@@ -2,9 +2,10 @@ from __future__ import annotations
 
 import asyncio
 from dataclasses import dataclass
+from functools import cached_property
 
 from app.chain import ChainProvider
-from app.portfolio import Category, Portfolio, PortfolioAsset
+from app.portfolio import Portfolio, PortfolioAsset
 from app.quotes import QuoteProvider
 
 
@@ -49,12 +50,36 @@ class PortfolioView:
     rebalance_warnings: list[str]
     warnings: list[str]
 
+    # Derived lookups, computed once per (immutable) view; not dataclass fields, so asdict() ignores them.
+    @cached_property
+    def flat_assets(self) -> tuple[AssetView, ...]:
+        out: list[AssetView] = []
+        for c in self.categories:
+            out.extend(c.assets)
+        out.extend(self.unassigned)
+        return tuple(out)
+
+    @cached_property
+    def assets_by_id(self) -> dict[str, AssetView]:
+        return {a.id: a for a in self.flat_assets}
+
+    def to_dict(self) -> dict:
+        # Same shape as dataclasses.asdict(), without its generic recursion and deepcopy of every leaf.
+        # Fields are listed explicitly: vars(self) would also pick up the cached properties above.
+        return {
+            "total_value": self.total_value,
+            "as_of": self.as_of,
+            "categories": [{**vars(c), "assets": [dict(vars(a)) for a in c.assets]} for c in self.categories],
+            "unassigned": [dict(vars(a)) for a in self.unassigned],
+            "rebalance_warnings": list(self.rebalance_warnings),
+            "warnings": list(self.warnings),
+        }
+
 
 async def compute_portfolio_view(*, portfolio: Portfolio, quotes: QuoteProvider, chain: ChainProvider) -> PortfolioView:
     asset_views, as_of = await _compute_assets(portfolio=portfolio, quotes=quotes, chain=chain)
     total_value = sum(a.value for a in asset_views)
 
-    categories_by_id: dict[str, Category] = {c.id: c for c in portfolio.categories}
     grouped: dict[str, list[AssetView]] = {c.id: [] for c in portfolio.categories}
     unassigned: list[AssetView] = []
     for a in asset_views:
@@ -65,7 +90,6 @@ async def compute_portfolio_view(*, portfolio: Portfolio, quotes: QuoteProvider,
 
     categories: list[CategoryView] = []
     rebalance_warnings: list[str] = []
-    warnings: list[str] = []
     for c in portfolio.categories:
         assets = grouped.get(c.id, [])
         value = sum(a.value for a in assets)
@@ -91,13 +115,14 @@ async def compute_portfolio_view(*, portfolio: Portfolio, quotes: QuoteProvider,
             )
         )
 
+    # Rebalance warnings lead; data problems follow.
+    warnings = list(rebalance_warnings)
     if unassigned:
         warnings.append(f"有 {len(unassigned)} 个资产未分配到四类资产桶（请在资产设置页拖动分配）")
     for a in asset_views:
         if a.status == "error":
             warnings.append(f"{a.name} 数据获取失败（{a.note or a.source}）")
 
-    warnings = rebalance_warnings + warnings
     return PortfolioView(
         total_value=total_value,
         as_of=as_of,
@@ -109,37 +134,38 @@ async def compute_portfolio_view(*, portfolio: Portfolio, quotes: QuoteProvider,
 
 
 async def _compute_assets(*, portfolio: Portfolio, quotes: QuoteProvider, chain: ChainProvider) -> tuple[list[AssetView], str | None]:
-    cn_assets = [a for a in portfolio.assets if a.kind == "cn" and a.code]
-    crypto_assets = [a for a in portfolio.assets if a.kind == "crypto" and a.coingecko_id]
-
-    cn_codes = [a.code for a in cn_assets]
-    cg_ids = [a.coingecko_id or "" for a in crypto_assets]
-
-    crypto_balance_assets = [a for a in crypto_assets if getattr(a, "manual_quantity", None) is None]
-    if crypto_balance_assets:
-        balances_task = asyncio.gather(
-            *[
-                chain.get_evm_token_balance(chain=a.chain or "", wallet=a.wallet or "", token_address=a.token_address)
-                for a in crypto_balance_assets
-            ],
-            return_exceptions=True,
-        )
-    else:
-        balances_task = asyncio.sleep(0, result=[])
-
-    cn_task = quotes.get_quotes_bulk(cn_codes)
-    cg_task = quotes.get_coingecko_markets_bulk(cg_ids)
-
-    cn_quotes, cg_markets, balances = await asyncio.gather(cn_task, cg_task, balances_task)
-    cn_map = cn_quotes
-    cg_map = cg_markets
-
-    balances_by_asset_id: dict[str, object] = {}
-    for a, b in zip(crypto_balance_assets, balances, strict=False):
-        balances_by_asset_id[a.id] = b
+    # Collect every upstream request up front (the kind partition is cached per portfolio version);
+    # the build loop below then only does lookups.
+    by_kind = portfolio.assets_by_kind
+    cn_codes = [a.code for a in by_kind.get("cn", ()) if a.code]
+    cg_ids: list[str] = []
+    balance_asset_ids: list[str] = []
+    balance_requests: list[tuple[str, str, str | None]] = []
+    for a in by_kind.get("crypto", ()):
+        if not a.coingecko_id:
+            continue
+        cg_ids.append(a.coingecko_id)
+        if a.manual_quantity is None:
+            balance_asset_ids.append(a.id)
+            balance_requests.append((a.chain or "", a.wallet or "", a.token_address))
+
+    # A failing fetch cancels its siblings instead of leaving them running unobserved. Per-balance
+    # failures never get here: get_many returns them in place.
+    try:
+        async with asyncio.TaskGroup() as tg:
+            cn_task = tg.create_task(quotes.get_quotes_bulk(cn_codes))
+            cg_task = tg.create_task(quotes.get_coingecko_markets_bulk(cg_ids))
+            balances_task = tg.create_task(chain.get_many(balance_requests)) if balance_requests else None
+    except ExceptionGroup as eg:
+        # Callers report "<type>: <message>"; surface the underlying error rather than the group.
+        raise eg.exceptions[0] from None
+    cn_map = cn_task.result()
+    cg_map = cg_task.result()
+    balances = balances_task.result() if balances_task is not None else []
+
+    balances_by_asset_id: dict[str, object] = dict(zip(balance_asset_ids, balances))
 
     out: list[AssetView] = []
-    as_of = None
     for asset in portfolio.assets:
         try:
             if asset.kind == "cash":
@@ -276,10 +302,9 @@ async def _compute_assets(*, portfolio: Portfolio, quotes: QuoteProvider, chain:
                 note=f"{type(e).__name__}: {e}",
             )
         out.append(v)
-        if as_of is None and v.as_of:
-            as_of = v.as_of
 
-    return out, as_of
+    # Portfolio as_of is the first asset (in portfolio order) that reports one.
+    return out, next((v.as_of for v in out if v.as_of), None)
 
 
 async def _compute_one(*, asset: PortfolioAsset, quotes: QuoteProvider, chain: ChainProvider) -> AssetView:
@@ -36,6 +36,13 @@ class ContributionSuggestion:
     categories: list[CategorySuggestion]
     note: str
 
+    def to_dict(self) -> dict:
+        # Same shape as dataclasses.asdict(), without its generic recursion and deepcopy of every leaf.
+        return {
+            **vars(self),
+            "categories": [{**vars(c), "assets": [dict(vars(a)) for a in c.assets]} for c in self.categories],
+        }
+
 
 def compute_contribution_suggestion(
     *,
@@ -98,53 +105,44 @@ def compute_contribution_suggestion(
             note="组合总市值为 0，建议先录入持仓或现金金额。",
         )
 
-    current_values = {c.id: c.value + prefill_by_category.get(c.id, 0.0) for c in view.categories}
-    target_value_after = {c.id: total_after * c.target_weight for c in view.categories}
-    deltas = {c.id: max(0.0, target_value_after[c.id] - current_values.get(c.id, 0.0)) for c in view.categories}
+    current_values: dict[str, float] = {}
+    target_value_after: dict[str, float] = {}
+    needs: dict[str, float] = {}  # underweight category -> value missing to reach its target
+    for c in view.categories:
+        current = current_values[c.id] = c.value + prefill_by_category.get(c.id, 0.0)
+        target = target_value_after[c.id] = total_after * c.target_weight
+        if target - current > 1e-6:
+            needs[c.id] = target - current
     remaining = contribution_amount_cny
     alloc = {c.id: 0.0 for c in view.categories}
 
-    # Iteratively fill underweight categories up to their delta.
-    while remaining > 1e-6:
-        positives = [(cid, d) for cid, d in deltas.items() if d > 1e-6]
-        if not positives:
-            break
-        total_need = sum(d for _, d in positives)
-        if total_need <= 1e-6:
-            break
-        for cid, d in positives:
-            share = remaining * (d / total_need)
-            take = min(d, share)
-            alloc[cid] += take
-            deltas[cid] -= take
-        new_remaining = contribution_amount_cny - sum(alloc.values())
-        if abs(new_remaining - remaining) < 1e-6:
-            break
-        remaining = new_remaining
+    # Fill underweight categories up to their delta, proportionally to need. This is closed form: either the
+    # contribution covers every delta (each takes its full delta), or it does not (each takes its share).
+    total_need = sum(needs.values())
+    if remaining > 1e-6 and total_need > 1e-6:
+        for cid, d in needs.items():
+            alloc[cid] = min(d, remaining * (d / total_need))
+        remaining = contribution_amount_cny - sum(alloc.values())
 
-    # If still remaining (e.g. already above target), put into lowest-weight categories.
+    # If still remaining (every category already at/above target), split it evenly across categories.
     if remaining > 1e-6:
-        ordered = sorted(view.categories, key=lambda c: c.weight)
-        per = remaining / max(1, len(ordered))
-        for c in ordered:
+        per = remaining / max(1, len(view.categories))
+        for c in view.categories:
             alloc[c.id] += per
         remaining = 0.0
 
     cats: list[CategorySuggestion] = []
-    categories_map = {c.id: c for c in view.categories}
     for c in view.categories:
         current_val = current_values.get(c.id, 0.0)
         new_val = current_val + alloc[c.id]
         per_assets: list[AssetBuySuggestion] = []
         if alloc[c.id] > 0:
-            cat_view = categories_map.get(c.id)
             buyables = []
-            if cat_view:
-                for a in cat_view.assets:
-                    if a.id in exclude_asset_ids:
-                        continue
-                    if a.kind in {"cn", "crypto", "cash"}:
-                        buyables.append(a)
+            for a in c.assets:
+                if a.id in exclude_asset_ids:
+                    continue
+                if a.kind in {"cn", "crypto", "cash"}:
+                    buyables.append(a)
             if not buyables:
                 if c.id == "cash":
                     per_assets.append(
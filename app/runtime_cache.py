@@ -1,8 +1,11 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
+from typing import Any
 
+from app.ledger import LedgerMetrics
+from app.lru import LRUCache
 from app.portfolio import Portfolio
 from app.rebalance import PortfolioView
 from app.total_history import TotalPoint
@@ -12,20 +15,51 @@ from app.total_history import TotalPoint
 class PortfolioRuntimeCache:
     portfolio: Portfolio | None = None
     portfolio_mtime: float | None = None
+    # In-memory portfolio has edits not yet written to portfolio.json.
+    portfolio_save_pending: bool = False
 
     view: PortfolioView | None = None
     updated_at: datetime | None = None
+    # time.monotonic() of the last successful refresh; used for age checks (updated_at is for display).
+    updated_mono: float | None = None
     last_duration_ms: float | None = None
     last_error: str | None = None
 
     snapshot_last_epoch: float | None = None
     refresh_running: bool = False
+    # Set by forced refresh requests (portfolio mutations); cleared when a refresh starts.
+    portfolio_dirty: bool = False
 
     # For adaptive refresh (reduce background work when nobody is using the UI).
-    last_access_at: datetime | None = None
+    # time.monotonic() of the last HTTP request.
+    last_access_mono: float | None = None
 
-    # Total-history endpoint cache (avoid re-parsing snapshots.jsonl on every page load).
-    total_history_key: str | None = None
-    total_history_loaded_at: float | None = None
-    total_history_snap_mtime: float | None = None
-    total_history_points: list[TotalPoint] | None = None
+    # Total-history endpoint cache (avoid re-parsing snapshots.jsonl on every page load), one entry per
+    # "<seconds>:<max_points>" so switching chart windows does not evict the others:
+    # key -> (snapshots.jsonl mtime, loaded at epoch, points).
+    total_history_points: LRUCache[str, tuple[float | None, float, list[TotalPoint]]] = field(
+        default_factory=lambda: LRUCache(8)
+    )
+    # Encoded /api/total-history bodies keyed on window, loaded points, last snapshot and current total.
+    total_history_bodies: LRUCache[tuple, bytes] = field(default_factory=lambda: LRUCache(8))
+
+    # /api/ui/state serialization cache: portfolio dump keyed on Portfolio.version, view dump on view identity.
+    portfolio_dump: dict[str, Any] | None = None
+    portfolio_dump_version: int | None = None
+    view_dump: dict[str, Any] | None = None
+    view_dump_for: PortfolioView | None = None
+
+    # Encoded /api/ui/state body and what it was built from.
+    ui_state_key: tuple | None = None
+    ui_state_view: PortfolioView | None = None
+    ui_state_body: bytes | None = None
+
+    # /api/ui/ledger-days encoded bodies per `manage` flag: manage -> (inputs key, JSON bytes).
+    ledger_days_cache: dict[bool, tuple[tuple, bytes]] = field(default_factory=dict)
+
+    # /api/v2/ledger/metrics memo: (asset id or None, value bucket, now bucket) -> LedgerMetrics,
+    # valid for the ledger file key in metrics_cache_for.
+    metrics_cache: LRUCache[tuple, LedgerMetrics] = field(default_factory=lambda: LRUCache(1024))
+    metrics_cache_for: tuple | None = None
+    # Last XIRR per asset id (None = whole portfolio), used to warm-start the next metrics request.
+    xirr_guess: dict[str | None, float] = field(default_factory=dict)
@@ -1,7 +1,9 @@
 from __future__ import annotations
 
+import asyncio
 import hashlib
 from datetime import date, datetime, timedelta
+from functools import lru_cache
 from zoneinfo import ZoneInfo
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
@@ -20,17 +22,29 @@ from app.rebalance import PortfolioView, compute_portfolio_view
 from app.settings import Settings
 
 
-def _is_workday_cn(d: date) -> bool:
-    try:
-        from chinese_calendar import is_workday  # type: ignore
+try:
+    from chinese_calendar import is_workday as _cn_is_workday  # type: ignore
+except Exception:
+    _cn_is_workday = None
+
 
-        return bool(is_workday(d))
-    except Exception:
-        return d.weekday() < 5
+def _is_workday_cn(d: date) -> bool:
+    if _cn_is_workday is not None:
+        try:
+            return bool(_cn_is_workday(d))
+        except Exception:
+            pass  # e.g. a year outside the library's holiday table
+    return d.weekday() < 5
 
 
 def first_workday_of_month_cn(d: date) -> date:
-    start = d.replace(day=1)
+    return _first_workday_of_month_cn(d.year, d.month)
+
+
+# The holiday table is fixed for the process; callers ask about the same month all month long.
+@lru_cache(maxsize=12)
+def _first_workday_of_month_cn(year: int, month: int) -> date:
+    start = date(year, month, 1)
     for i in range(0, 10):
         cand = start + timedelta(days=i)
         if _is_workday_cn(cand):
@@ -38,7 +52,7 @@ def first_workday_of_month_cn(d: date) -> date:
     return start
 
 
-def _warnings_hash(view: PortfolioView) -> str:
+def warnings_hash(view: PortfolioView) -> str:
     h = hashlib.sha256()
     for w in sorted(view.rebalance_warnings):
         h.update(w.encode("utf-8"))
@@ -94,8 +108,9 @@ def format_email_body(view: PortfolioView) -> str:
 async def maybe_send_threshold_email(*, settings: Settings, quotes: QuoteProvider, chain: ChainProvider, reason: str) -> None:
     if not settings.email_enabled:
         return
-    state = load_notification_state()
-    portfolio = load_portfolio()
+    state, portfolio = await asyncio.gather(
+        asyncio.to_thread(load_notification_state), asyncio.to_thread(load_portfolio)
+    )
     view = await compute_portfolio_view(portfolio=portfolio, quotes=quotes, chain=chain)
     await maybe_send_threshold_email_for_view(settings=settings, view=view, reason=reason, state=state)
 
@@ -109,58 +124,78 @@ async def maybe_send_threshold_email_for_view(
 ) -> None:
     if not settings.email_enabled:
         return
-    state = state or load_notification_state()
     if not view.rebalance_warnings:
         return
+    state = state or await asyncio.to_thread(load_notification_state)
+    if await _send_threshold_email(settings=settings, view=view, reason=reason, state=state):
+        await asyncio.to_thread(save_notification_state, state)
+
 
-    wh = _warnings_hash(view)
+async def _send_threshold_email(
+    *, settings: Settings, view: PortfolioView, reason: str, state: NotificationState, body: str | None = None
+) -> bool:
+    # Sends the threshold mail unless still cooling down; returns whether `state` was updated (caller saves it).
+    # `body` is the already rendered format_email_body(view), if the caller has it.
+    wh = warnings_hash(view)
     if not should_send_threshold(state=state, warnings_hash=wh, cooldown_minutes=settings.notify_cooldown_minutes):
-        return
+        return False
 
-    ok, err = send_email(
+    ok, err = await asyncio.to_thread(
+        send_email,
         settings=settings,
         subject=f"永久投资组合：触发再平衡阈值（{reason}）",
-        body=format_email_body(view),
+        body=body if body is not None else format_email_body(view),
     )
     if ok:
         state.threshold_last_sent_epoch = datetime.now(tz=ZoneInfo(settings.timezone)).timestamp()
         state.threshold_last_hash = wh
         state.last_error = None
-        save_notification_state(state)
     else:
         state.last_error = err
-        save_notification_state(state)
+    return True
 
 
 async def daily_job(*, settings: Settings, quotes: QuoteProvider, chain: ChainProvider) -> None:
     if not settings.email_enabled:
         return
     today = datetime.now(tz=ZoneInfo(settings.timezone)).date()
-    state = load_notification_state()
+    state, portfolio = await asyncio.gather(
+        asyncio.to_thread(load_notification_state), asyncio.to_thread(load_portfolio)
+    )
+    # Both mails below update `state`; it is written once at the end.
+    dirty = False
+    # Both mails carry the same body; rendered at most once.
+    body: str | None = None
 
-    portfolio = load_portfolio()
     view = await compute_portfolio_view(portfolio=portfolio, quotes=quotes, chain=chain)
 
     # 1) 每月第一个工作日：固定提醒查看
     first = first_workday_of_month_cn(today)
     yyyymm = today.strftime("%Y-%m")
     if today == first and state.monthly_last_sent_yyyymm != yyyymm:
-        ok, err = send_email(
+        body = format_email_body(view)
+        ok, err = await asyncio.to_thread(
+            send_email,
             settings=settings,
             subject=f"永久投资组合：{yyyymm} 再平衡检查提醒（第一个工作日）",
-            body=format_email_body(view),
+            body=body,
         )
         if ok:
             state.monthly_last_sent_yyyymm = yyyymm
             state.last_error = None
-            save_notification_state(state)
         else:
             state.last_error = err
-            save_notification_state(state)
+        dirty = True
 
     # 2) 若触发阈值：发提醒（带冷却）
     if view.rebalance_warnings:
-        await maybe_send_threshold_email_for_view(settings=settings, view=view, reason="scheduled", state=state)
+        if await _send_threshold_email(
+            settings=settings, view=view, reason="scheduled", state=state, body=body
+        ):
+            dirty = True
+
+    if dirty:
+        await asyncio.to_thread(save_notification_state, state)
 
 
 def start_scheduler(*, settings: Settings, quotes: QuoteProvider, chain: ChainProvider) -> AsyncIOScheduler:
@@ -69,10 +69,17 @@ class SettingsOverride(BaseModel):
     smtp_use_starttls: bool | None = None
 
 
+def settings_override_key() -> tuple | None:
+    """Identity of the override file's current contents (mtime_ns, size); None if absent."""
+    try:
+        st = SETTINGS_OVERRIDE_PATH.stat()
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
 def load_settings_override() -> SettingsOverride | None:
     try:
-        if not SETTINGS_OVERRIDE_PATH.exists():
-            return None
         raw = SETTINGS_OVERRIDE_PATH.read_text(encoding="utf-8").strip()
         if not raw:
             return None
@@ -1,15 +1,22 @@
 from __future__ import annotations
 
-import json
 import time
 from pathlib import Path
 from typing import Any
 
+import orjson
+
 from app.rebalance import PortfolioView
+from app.total_history import append_total_record, build_totals_file, totals_path_for
 
 DATA_DIR = Path(__file__).resolve().parent.parent / "data"
 SNAPSHOT_PATH = DATA_DIR / "snapshots.jsonl"
 
+# A snapshot identical to the last one written is skipped, but one is still written at least this often.
+SNAPSHOT_DEDUP_MAX_SECONDS = 15 * 60
+# (ts, dedup key) of the last line this process appended.
+_last_written: tuple[float, tuple] | None = None
+
 
 def _view_to_snapshot(view: PortfolioView, *, ts: float) -> dict[str, Any]:
     cats = []
@@ -36,12 +43,29 @@ def _view_to_snapshot(view: PortfolioView, *, ts: float) -> dict[str, Any]:
 
 
 def maybe_append_snapshot(*, view: PortfolioView, last_epoch: float | None, min_interval_seconds: int = 60) -> float:
+    global _last_written
     now = time.time()
     if last_epoch is not None and (now - last_epoch) < min_interval_seconds:
         return last_epoch
 
-    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    if not SNAPSHOT_PATH.exists() or not totals_path_for(SNAPSHOT_PATH).exists():
+        DATA_DIR.mkdir(parents=True, exist_ok=True)
+        # Index the existing JSONL history (or reset a stale index) before the first binary append.
+        build_totals_file(path=SNAPSHOT_PATH)
     snap = _view_to_snapshot(view, ts=now)
-    with SNAPSHOT_PATH.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(snap, ensure_ascii=False) + "\n")
+    # Quiet periods (markets closed, nothing edited) would otherwise append the same row every interval.
+    key = (
+        snap["as_of"],
+        snap["total_value"],
+        tuple(tuple(c.values()) for c in snap["categories"]),
+        tuple(snap["rebalance_warnings"]),
+        tuple(snap["warnings"]),
+    )
+    if _last_written is not None and _last_written[1] == key and now - _last_written[0] < SNAPSHOT_DEDUP_MAX_SECONDS:
+        return now
+
+    with SNAPSHOT_PATH.open("ab") as f:
+        f.write(orjson.dumps(snap) + b"\n")
+    append_total_record(path=SNAPSHOT_PATH, ts=now, value=snap["total_value"])
+    _last_written = (now, key)
     return now
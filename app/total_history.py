@@ -2,17 +2,34 @@ from __future__ import annotations
 
 import json
 import math
+import mmap
+import os
+import struct
 import time
 from dataclasses import dataclass
 from pathlib import Path
+from typing import Iterator
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class TotalPoint:
     ts: float
     value: float
 
 
+# snapshots.bin: fixed-size (ts, total_value) records appended alongside snapshots.jsonl.
+TOTAL_RECORD = struct.Struct("<dd")
+
+
+# JSONL fallback (no snapshots.bin yet): read the tail in chunks of this size, up to a cap.
+_TAIL_CHUNK_BYTES = 256 * 1024
+_TAIL_MAX_READ_BYTES = 8 * 1024 * 1024
+
+
+def totals_path_for(path: Path) -> Path:
+    return path.with_suffix(".bin")
+
+
 def parse_window_seconds(window: str) -> int:
     w = (window or "").strip().lower()
     if not w:
@@ -46,72 +63,133 @@ def _downsample(points: list[TotalPoint], max_points: int) -> list[TotalPoint]:
     return out
 
 
+def _iter_jsonl_points(raw_lines) -> Iterator[tuple[float, float | None]]:
+    # Yields (ts, total_value) per parseable line; ts <= 0 or a None value mark unusable fields.
+    for raw in raw_lines:
+        if not raw or not raw.strip():
+            continue
+        try:
+            obj = json.loads(raw)
+        except Exception:
+            continue
+        try:
+            ts = float(obj.get("ts") or 0.0)
+        except Exception:
+            ts = 0.0
+        try:
+            val = float(obj.get("total_value"))
+        except Exception:
+            val = None
+        yield ts, val
+
+
+def build_totals_file(*, path: Path) -> None:
+    """
+    (Re)build snapshots.bin from snapshots.jsonl. Written to a temp file and swapped in.
+    """
+    bin_path = totals_path_for(path)
+    records = []
+    if path.exists():
+        with path.open("rb") as f:
+            records = [(ts, val) for ts, val in _iter_jsonl_points(f) if ts > 0 and val is not None]
+    records.sort(key=lambda r: r[0])
+    tmp = bin_path.with_name(bin_path.name + ".tmp")
+    with tmp.open("wb") as f:
+        f.write(b"".join(TOTAL_RECORD.pack(ts, val) for ts, val in records))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, bin_path)
+
+
+def append_total_record(*, path: Path, ts: float, value: float) -> None:
+    bin_path = totals_path_for(path)
+    with bin_path.open("a+b") as f:
+        size = f.seek(0, 2)
+        torn = size % TOTAL_RECORD.size
+        if torn:
+            # Drop a partially written record so the file stays aligned.
+            f.truncate(size - torn)
+        f.write(TOTAL_RECORD.pack(float(ts), float(value)))
+
+
+def _load_points_bin(bin_path: Path, start_ts: float, max_points: int) -> list[TotalPoint]:
+    rec = TOTAL_RECORD
+    with bin_path.open("rb") as f:
+        n = f.seek(0, 2) // rec.size
+        # Records are appended in time order: binary search the window start on disk.
+        lo, hi = 0, n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            f.seek(mid * rec.size)
+            ts, _ = rec.unpack(f.read(rec.size))
+            if ts < start_ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        f.seek(lo * rec.size)
+        buf = f.read((n - lo) * rec.size)
+    count = len(buf) // rec.size
+    if 0 < max_points < count:
+        # Same picks as _downsample, made on the raw records so only the survivors are unpacked.
+        step = int(math.ceil(count / max_points))
+        picks = list(range(0, count, step))
+        if picks[-1] != count - 1:
+            picks.append(count - 1)
+        rows = [rec.unpack_from(buf, i * rec.size) for i in picks]
+    else:
+        rows = rec.iter_unpack(buf)
+    points = [TotalPoint(ts=ts, value=val) for ts, val in rows if ts >= start_ts]
+    points.sort(key=lambda p: p.ts)
+    return points
+
+
 def load_total_history_points(
     *, path: Path, since_seconds: int, max_points: int = 240, now_epoch: float | None = None
 ) -> list[TotalPoint]:
     now = float(now_epoch or time.time())
     start_ts = now - float(max(1, int(since_seconds)))
-    if not path.exists():
+
+    try:
+        file_size = path.stat().st_size
+    except FileNotFoundError:
         return []
 
-    file_size = path.stat().st_size
+    try:
+        return _load_points_bin(totals_path_for(path), start_ts, max_points)
+    except FileNotFoundError:
+        pass  # no index yet: fall back to the JSONL tail
+
     if file_size <= 0:
         return []
 
-    # Read from the end of the JSONL file and expand until we cover the window
-    # (keeps CPU/IO low even if snapshots grow for months).
-    chunk = 256 * 1024
-    max_read = 8 * 1024 * 1024
-    read_size = min(file_size, chunk)
-
+    # Walk the memory-mapped JSONL file backwards in line-aligned chunks until the window is covered, parsing
+    # each line once (keeps CPU/IO low even if snapshots grow for months; only the tail pages are touched).
     points: list[TotalPoint] = []
-    earliest_in_buf: float | None = None
-
-    with path.open("rb") as f:
-        while True:
-            f.seek(max(0, file_size - read_size))
-            buf = f.read(read_size)
-
-            if file_size > read_size:
-                nl = buf.find(b"\n")
-                if nl >= 0:
-                    buf = buf[nl + 1 :]
-
-            points = []
-            earliest_in_buf = None
-            for raw in buf.splitlines():
-                if not raw or not raw.strip():
-                    continue
-                try:
-                    obj = json.loads(raw)
-                except Exception:
-                    continue
-                try:
-                    ts = float(obj.get("ts") or 0.0)
-                except Exception:
-                    ts = 0.0
+    earliest: float | None = None
+
+    with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        end = len(mm)
+        pos = end
+        while pos > 0 and end - pos < _TAIL_MAX_READ_BYTES:
+            start = max(0, pos - _TAIL_CHUNK_BYTES)
+            if start > 0:
+                # Back up to the start of the line the chunk boundary falls in.
+                start = mm.rfind(b"\n", 0, start) + 1
+            for ts, val in _iter_jsonl_points(mm[start:pos].splitlines()):
                 if ts <= 0:
                     continue
-                if earliest_in_buf is None or ts < earliest_in_buf:
-                    earliest_in_buf = ts
-                if ts < start_ts:
-                    continue
-                try:
-                    val = float(obj.get("total_value"))
-                except Exception:
+                if earliest is None or ts < earliest:
+                    earliest = ts
+                if ts < start_ts or val is None:
                     continue
                 points.append(TotalPoint(ts=ts, value=val))
+            pos = start
 
-            points.sort(key=lambda p: p.ts)
-
-            have_window = earliest_in_buf is not None and earliest_in_buf <= start_ts
-            at_file_start = read_size >= file_size
-            if have_window or at_file_start:
-                break
-            if read_size >= max_read:
+            if earliest is not None and earliest <= start_ts:
                 break
-            read_size = min(file_size, read_size * 2)
 
+    # Chunks arrive newest first (and lines are not guaranteed to be in order).
+    points.sort(key=lambda p: p.ts)
     return _downsample(points, max_points=max_points)
 
 
@@ -123,17 +201,17 @@ def build_total_history_payload(
     window: str,
 ) -> dict:
     now = float(now_epoch or time.time())
-    series = list(points)
-    if current_value is not None:
-        if not series or abs(series[-1].ts - now) > 0.5:
-            series.append(TotalPoint(ts=now, value=float(current_value)))
+    out_points = [{"t": p.ts, "v": p.value} for p in points]
+    # Append a synthetic "now" point unless the last stored one already is current.
+    if current_value is not None and (not points or abs(points[-1].ts - now) > 0.5):
+        out_points.append({"t": now, "v": float(current_value)})
 
-    if not series:
+    if not out_points:
         baseline = float(current_value or 0.0)
         current = float(current_value or 0.0)
     else:
-        baseline = float(series[0].value)
-        current = float(series[-1].value)
+        baseline = float(out_points[0]["v"])
+        current = float(out_points[-1]["v"])
 
     change_value = current - baseline
     if baseline > 0:
@@ -148,5 +226,5 @@ def build_total_history_payload(
         "current_value": current,
         "change_value": change_value,
         "change_pct": change_pct,
-        "points": [{"t": p.ts, "v": p.value} for p in series],
+        "points": out_points,
     }
@@ -0,0 +1,62 @@
+import asyncio
+
+import app.main as main_mod
+import app.portfolio as portfolio_mod
+from app.portfolio import Portfolio, PortfolioAsset
+from app.quotes import Quote, QuoteProvider
+from app.rebalance import compute_portfolio_view
+from app.runtime_cache import PortfolioRuntimeCache
+
+
+class _GatedQuotes(QuoteProvider):
+    # Holds get_quotes_bulk until `release` is set, so a handler can run while the fetch is pending.
+    def __init__(self, prices: dict[str, float]):
+        self._prices = prices
+        self.pending = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def get_quotes_bulk(self, codes: list[str]) -> dict[str, Quote]:  # type: ignore[override]
+        self.pending.set()
+        await self.release.wait()
+        return {
+            c: Quote(code=c, name=c, price=self._prices.get(c), change_pct=0.0, as_of="t", source="stub") for c in codes
+        }
+
+    async def get_coingecko_markets_bulk(self, ids: list[str]):  # type: ignore[override]
+        return {}
+
+
+def test_asset_added_during_pending_refresh_does_not_break_its_view(monkeypatch, tmp_path) -> None:
+    monkeypatch.setattr(portfolio_mod, "DATA_DIR", tmp_path)
+    monkeypatch.setattr(portfolio_mod, "PORTFOLIO_PATH", tmp_path / "portfolio.json")
+    monkeypatch.setattr(main_mod, "PORTFOLIO_PATH", tmp_path / "portfolio.json")
+    monkeypatch.setattr(main_mod, "runtime_cache", PortfolioRuntimeCache())
+    monkeypatch.setattr(main_mod, "trigger_cache_refresh", lambda **_: None)
+
+    portfolio = Portfolio(
+        categories=Portfolio.default().categories,
+        assets=[PortfolioAsset(kind="cn", code="510300", name="A", quantity=2, category_id="equity")],
+    )
+    main_mod.runtime_cache.portfolio = portfolio
+    main_mod.runtime_cache.portfolio_save_pending = True  # keep get_portfolio_cached off the (empty) file
+    quotes = _GatedQuotes({"510300": 10.0, "600519": 100.0})
+
+    async def run():
+        refresh = asyncio.create_task(
+            compute_portfolio_view(portfolio=main_mod.get_portfolio_cached(), quotes=quotes, chain=None)
+        )
+        await quotes.pending.wait()
+        r = await main_mod.api_v2_assets_create(
+            main_mod.ApiAssetCreateRequest(kind="cn", code="600519", quantity=1, category_id="equity")
+        )
+        assert r.status_code == 200
+        quotes.release.set()
+        return await refresh
+
+    view = asyncio.run(run())
+
+    # The in-flight view reflects the portfolio it started from; the edit lands in the next one.
+    assert view.total_value == 20.0
+    assert [a.status for a in view.flat_assets] == ["ok"]
+    assert len(portfolio.assets) == 1
+    assert [a.code for a in main_mod.runtime_cache.portfolio.assets] == ["510300", "600519"]
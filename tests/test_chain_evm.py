@@ -0,0 +1,192 @@
+import asyncio
+import json
+
+import httpx
+
+import app.chain as chain_mod
+from app.chain import ChainProvider, _CacheEntry
+
+WALLET = "0x" + "ab" * 20
+TOKEN = "0x" + "cd" * 20
+
+
+def _abi_string(s: str) -> str:
+    raw = s.encode("utf-8")
+    body = (32).to_bytes(32, "big") + len(raw).to_bytes(32, "big") + raw.ljust(32, b"\x00")
+    return "0x" + body.hex()
+
+
+def _make_handler(posts: list[object]):
+    def handler(request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        posts.append(payload)
+        calls = payload if isinstance(payload, list) else [payload]
+        results = []
+        for c in calls:
+            data = c["params"][0]["data"]
+            if data == "0x313ce567":
+                res = hex(6)
+            elif data == "0x95d89b41":
+                res = _abi_string("USDC")
+            else:
+                res = hex(12_500_000)
+            results.append({"jsonrpc": "2.0", "id": c["id"], "result": res})
+        return httpx.Response(200, json=results if isinstance(payload, list) else results[0])
+
+    return handler
+
+
+def test_erc20_balance_uses_single_batch_on_cold_meta(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("PP_RPC_ETH", "https://rpc.example")
+    monkeypatch.setattr(chain_mod, "TOKEN_META_PATH", tmp_path / "token_meta.json")
+    posts: list[object] = []
+    handler = _make_handler(posts)
+
+    async def run():
+        provider = ChainProvider()
+        await provider.close()
+        provider._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        first = await provider.get_evm_token_balance(chain="eth", wallet=WALLET, token_address=TOKEN)
+        provider._balance_cache.clear()
+        second = await provider.get_evm_token_balance(chain="eth", wallet=WALLET, token_address=TOKEN)
+        await provider.close()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first.error is None
+    assert first.quantity == 12.5
+    assert first.symbol == "USDC"
+    assert second.quantity == 12.5
+    # Cold meta: one batched POST; warm meta: one plain balanceOf POST.
+    assert len(posts) == 2
+    assert isinstance(posts[0], list) and len(posts[0]) == 3
+    assert isinstance(posts[1], dict)
+
+
+def test_balance_cache_coalesces_misses_and_serves_stale(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("PP_RPC_ETH", "https://rpc.example")
+    monkeypatch.setattr(chain_mod, "TOKEN_META_PATH", tmp_path / "token_meta.json")
+    posts: list[object] = []
+    handler = _make_handler(posts)
+
+    async def run():
+        provider = ChainProvider()
+        await provider.close()
+        provider._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        many = await provider.get_many([("eth", WALLET, TOKEN)] * 5)
+        n_after_miss = len(posts)
+
+        key = next(iter(provider._balance_cache))
+        entry = provider._balance_cache[key]
+        provider._balance_cache[key] = _CacheEntry(ts=entry.ts - 1.0, ttl=0.0, value=entry.value, stale_ttl=60.0)
+        stale = await provider.get_evm_token_balance(chain="eth", wallet=WALLET, token_address=TOKEN)
+        await asyncio.gather(*provider._inflight.values())
+        await provider.close()
+        return many, n_after_miss, stale
+
+    many, n_after_miss, stale = asyncio.run(run())
+    assert [b.quantity for b in many] == [12.5] * 5
+    assert n_after_miss == 1
+    assert stale.quantity == 12.5
+    # Stale hit returned immediately and triggered exactly one background refresh.
+    assert len(posts) == 2
+
+
+def test_token_meta_is_flushed_off_the_event_loop(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("PP_RPC_ETH", "https://rpc.example")
+    meta_path = tmp_path / "token_meta.json"
+    monkeypatch.setattr(chain_mod, "TOKEN_META_PATH", meta_path)
+    handler = _make_handler([])
+
+    async def run():
+        provider = ChainProvider()
+        await provider.close()
+        provider._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        provider.meta_flush_interval_seconds = 0.0
+        await provider.get_evm_token_balance(chain="eth", wallet=WALLET, token_address=TOKEN)
+        # The periodic flush runs in a worker thread; close() waits for it.
+        assert provider._flush_task is not None
+        await provider._flush_task
+        written = json.loads(meta_path.read_text())
+        await provider.close()
+        return written
+
+    written = asyncio.run(run())
+    assert written == {f"eth:{TOKEN.lower()}": {"decimals": 6, "symbol": "USDC"}}
+    assert not list(tmp_path.glob("*.tmp*"))
+
+
+def test_rpc_calls_are_capped_per_endpoint(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("PP_RPC_ETH", "https://rpc.example")
+    monkeypatch.setattr(chain_mod, "TOKEN_META_PATH", tmp_path / "token_meta.json")
+    posts: list[object] = []
+    sync_handler = _make_handler(posts)
+    active = peak = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return sync_handler(request)
+
+    tokens = ["0x" + f"{i:040x}" for i in range(1, 21)]
+
+    async def run():
+        provider = ChainProvider()
+        await provider.close()
+        provider._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        out = await provider.get_many([("eth", WALLET, t) for t in tokens])
+        await provider.close()
+        return provider, out
+
+    provider, out = asyncio.run(run())
+    assert [b.quantity for b in out] == [12.5] * len(tokens)
+    assert len(posts) == len(tokens)
+    assert peak == provider.max_concurrency_per_rpc
+
+
+def test_token_meta_survives_restart(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("PP_RPC_ETH", "https://rpc.example")
+    monkeypatch.setattr(chain_mod, "TOKEN_META_PATH", tmp_path / "token_meta.json")
+    posts: list[object] = []
+    handler = _make_handler(posts)
+
+    async def run():
+        out = []
+        for _ in range(2):
+            provider = ChainProvider()
+            await provider.close()
+            provider._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            out.append(await provider.get_evm_token_balance(chain="eth", wallet=WALLET, token_address=TOKEN))
+            await provider.close()
+        return out
+
+    first, second = asyncio.run(run())
+    assert (tmp_path / "token_meta.json").exists()
+    assert first.quantity == second.quantity == 12.5
+    assert second.symbol == "USDC"
+    # Second provider loaded meta from disk and only asked for balanceOf.
+    assert isinstance(posts[0], list)
+    assert isinstance(posts[1], dict)
+
+
+def test_rpc_timeout_maps_to_timeout_error(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("PP_RPC_ETH", "https://rpc.example")
+    monkeypatch.setattr(chain_mod, "TOKEN_META_PATH", tmp_path / "token_meta.json")
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise httpx.ReadTimeout("slow node", request=request)
+
+    async def run():
+        provider = ChainProvider()
+        await provider.close()
+        provider._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        bal = await provider.get_evm_token_balance(chain="eth", wallet=WALLET, token_address=None)
+        await provider.close()
+        return bal
+
+    bal = asyncio.run(run())
+    assert bal.quantity is None
+    assert bal.error == "TimeoutError: rpc timeout"
@@ -6,3 +6,11 @@ def test_encrypt_decrypt_roundtrip() -> None:
     assert token and token != "secret"
     assert decrypt_str(token) == "secret"
 
+
+
+def test_decrypt_legacy_fernet_token() -> None:
+    from app.crypto_store import _fernet
+
+    legacy = _fernet().encrypt(b"old-secret").decode("ascii")
+    assert decrypt_str(legacy) == "old-secret"
+    assert decrypt_str("not-a-token") is None
@@ -0,0 +1,16 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from app.fileio import write_bytes_atomic
+
+
+def test_concurrent_atomic_writes_never_share_a_temp_file(tmp_path) -> None:
+    path = tmp_path / "state.json"
+    payloads = [bytes([65 + i]) * 100_000 for i in range(8)]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        for _ in range(5):
+            list(pool.map(lambda data: write_bytes_atomic(path, data), payloads))
+
+    # Whichever writer won, the file holds exactly one payload and no temp files are left behind.
+    assert path.read_bytes() in payloads
+    assert [p.name for p in tmp_path.iterdir()] == ["state.json"]
@@ -0,0 +1,52 @@
+import json
+
+
+def _use_tmp_ledger(monkeypatch, tmp_path):
+    import app.ledger as ledger_mod
+
+    monkeypatch.setattr(ledger_mod, "DATA_DIR", tmp_path)
+    monkeypatch.setattr(ledger_mod, "LEDGER_PATH", tmp_path / "ledger.jsonl")
+    monkeypatch.setattr(ledger_mod, "LEGACY_LEDGER_PATH", tmp_path / "ledger.json")
+    return ledger_mod
+
+
+def test_ledger_migrates_legacy_json_and_appends(monkeypatch, tmp_path) -> None:
+    ledger_mod = _use_tmp_ledger(monkeypatch, tmp_path)
+    (tmp_path / "ledger.json").write_text(
+        json.dumps([{"id": "b", "ts": 200, "amount_cny": 5}, {"id": "a", "ts": 100, "amount_cny": 10}]),
+        encoding="utf-8",
+    )
+
+    assert [e.id for e in ledger_mod.load_ledger()] == ["a", "b"]
+
+    ledger_mod.add_ledger_entry(ledger_mod.LedgerEntry(id="c", ts=150, amount_cny=1, direction="withdraw"))
+    lines = (tmp_path / "ledger.jsonl").read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 3
+    assert [e.id for e in ledger_mod.load_ledger()] == ["a", "c", "b"]
+
+    assert ledger_mod.delete_ledger_entry("a") is True
+    assert [e.id for e in ledger_mod.load_ledger()] == ["c", "b"]
+
+
+def test_xirr_simple_annual_return() -> None:
+    from app.ledger import xirr
+
+    year = 365.0 * 24.0 * 3600.0
+    rate = xirr([(0.0, -1000.0), (year, 1100.0)])
+    assert rate is not None
+    assert abs(rate - 0.10) < 1e-9
+
+
+def test_cashflow_indexes_hit_skips_ledger_load(monkeypatch, tmp_path) -> None:
+    ledger_mod = _use_tmp_ledger(monkeypatch, tmp_path)
+    monkeypatch.setattr(ledger_mod, "_index_cache", None)
+    (tmp_path / "ledger.json").write_text(json.dumps([{"id": "a", "ts": 100, "amount_cny": 10, "asset_id": "x"}]))
+
+    total, per_asset = ledger_mod.load_cashflow_indexes()  # migrates the legacy file on the way
+    assert total.principal == 10.0 and set(per_asset) == {"x"}
+
+    def fail():
+        raise AssertionError("cache hit must not reload the ledger")
+
+    monkeypatch.setattr(ledger_mod, "load_ledger", fail)
+    assert ledger_mod.load_cashflow_indexes() == (total, per_asset)
@@ -0,0 +1,58 @@
+from dataclasses import replace
+
+from app.settings import Settings
+
+
+class _FakeSMTP:
+    instances: list["_FakeSMTP"] = []
+
+    def __init__(self, host, port, timeout=None) -> None:
+        self.sent: list = []
+        self.logins = 0
+        _FakeSMTP.instances.append(self)
+
+    def ehlo(self):
+        return 250, b"ok"
+
+    def starttls(self):
+        return 220, b"ok"
+
+    def login(self, user, password):
+        self.logins += 1
+
+    def noop(self):
+        return 250, b"ok"
+
+    def send_message(self, msg):
+        self.sent.append(msg["Subject"])
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_mailer_reuses_one_session(monkeypatch) -> None:
+    import app.mailer as mailer_mod
+
+    _FakeSMTP.instances = []
+    monkeypatch.setattr(mailer_mod.smtplib, "SMTP", _FakeSMTP)
+    settings = replace(
+        Settings.load(),
+        email_enabled=True,
+        smtp_host="smtp.example.com",
+        smtp_username="u",
+        smtp_password="p",
+        mail_from="from@example.com",
+        mail_to=["to@example.com"],
+    )
+
+    m = mailer_mod.Mailer()
+    res = m.send_many(settings=settings, messages=[("a", "1"), ("b", "2")])
+    assert res == [(True, None), (True, None)]
+    assert m.send(settings=settings, subject="c", body="3") == (True, None)
+
+    assert len(_FakeSMTP.instances) == 1
+    assert _FakeSMTP.instances[0].logins == 1
+    assert _FakeSMTP.instances[0].sent == ["a", "b", "c"]
@@ -1,4 +1,10 @@
-from app.quotes import _parse_eastmoney_fundgz, _parse_tencent_qt, _tencent_symbol
+import asyncio
+
+import httpx
+
+import app.quotes as quotes_mod
+from app.lru import LRUCache
+from app.quotes import Quote, QuoteProvider, _CacheEntry, _parse_eastmoney_fundgz, _parse_tencent_qt, _tencent_symbol
 
 
 def test_tencent_symbol_mapping() -> None:
@@ -27,6 +33,24 @@ def test_parse_tencent_qt_basic() -> None:
     assert q.as_of == "20260123161414"
 
 
+def test_tencent_bulk_name_with_tilde_trail_byte() -> None:
+    # In GBK the second byte of 硚 is 0x7E ('~'): the payload must be decoded before it is split on '~'.
+    name = "硚口发展"
+    assert b"~" in name.encode("gbk")
+    fields = ["1", name, "600001", "12.34", "12.10"] + [""] * 25 + ["20260123161414", "0.24", "2.00"]
+    body = ('v_sh600001="' + "~".join(fields) + '~";\n').encode("gbk")
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=body, headers={"Content-Type": "text/html; charset=GBK"})
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await quotes_mod._fetch_tencent_cn_quotes_bulk(client, {"sh600001": "600001"})
+
+    q = asyncio.run(run())["600001"]
+    assert (q.name, q.price, q.change_pct, q.as_of) == (name, 12.34, 2.0, "20260123161414")
+
+
 def test_parse_eastmoney_fundgz_basic() -> None:
     text = "jsonpgz({\"fundcode\":\"161725\",\"name\":\"招商中证白酒\",\"gsz\":\"1.2345\",\"gszzl\":\"-0.56\",\"gztime\":\"2026-01-25 14:30\"});"
     q = _parse_eastmoney_fundgz(text=text, code="161725")
@@ -35,3 +59,161 @@ def test_parse_eastmoney_fundgz_basic() -> None:
     assert q.price == 1.2345
     assert q.change_pct == -0.56
     assert q.as_of == "2026-01-25 14:30"
+
+
+def test_quotes_bulk_serves_stale_and_revalidates_once(monkeypatch, tmp_path) -> None:
+    monkeypatch.setattr(quotes_mod, "QUOTE_CACHE_PATH", tmp_path / "quote_cache.json")
+    calls: list[list[str]] = []
+
+    async def fake_bulk(client, sym_map):
+        calls.append(sorted(sym_map.values()))
+        price = float(len(calls))
+        return {c: Quote(code=c, name="", price=price, change_pct=0.0, as_of=None, source="tencent") for c in sym_map.values()}
+
+    monkeypatch.setattr(quotes_mod, "_fetch_tencent_cn_quotes_bulk", fake_bulk)
+
+    async def run():
+        provider = QuoteProvider()
+        first = await provider.get_quotes_bulk(["510300", "600519"])
+
+        entry = provider._cache["510300"]
+        provider._cache["510300"] = _CacheEntry(ts=entry.ts - 10.0, ttl=1.0, quote=entry.quote, stale_ttl=60.0)
+        stale = await provider.get_quotes_bulk(["510300", "600519"])
+        again = await provider.get_quotes_bulk(["510300"])
+        await asyncio.gather(*set(provider._inflight.values()))
+        fresh = await provider.get_quotes_bulk(["510300"])
+        await provider.close()
+        return first, stale, again, fresh
+
+    first, stale, again, fresh = asyncio.run(run())
+    assert first["510300"].price == 1.0
+    # Stale hits are returned immediately; concurrent stale reads share one background refresh.
+    assert stale["510300"].price == 1.0 and again["510300"].price == 1.0
+    assert calls == [["510300", "600519"], ["510300"]]
+    assert fresh["510300"].price == 2.0
+
+
+def test_concurrent_quote_misses_share_inflight_fetches(monkeypatch, tmp_path) -> None:
+    monkeypatch.setattr(quotes_mod, "QUOTE_CACHE_PATH", tmp_path / "quote_cache.json")
+    calls: list[list[str]] = []
+
+    async def fake_bulk(client, sym_map):
+        calls.append(sorted(sym_map.values()))
+        await asyncio.sleep(0.01)
+        return {c: Quote(code=c, name="", price=1.0, change_pct=0.0, as_of=None, source="tencent") for c in sym_map.values()}
+
+    monkeypatch.setattr(quotes_mod, "_fetch_tencent_cn_quotes_bulk", fake_bulk)
+
+    async def run():
+        provider = QuoteProvider()
+        results = await asyncio.gather(
+            provider.get_quotes_bulk(["510300", "600519"]),
+            provider.get_quotes_bulk(["600519", "000001"]),
+            provider.get_quote("510300"),
+        )
+        await provider.close()
+        return results
+
+    a, b, single = asyncio.run(run())
+    # Keys already in flight are awaited, not refetched; only 000001 needed a second request.
+    assert calls == [["510300", "600519"], ["000001"]]
+    assert a["600519"].price == b["600519"].price == single.price == 1.0
+    assert b["000001"].price == 1.0
+
+
+def test_coingecko_bulk_chunks_retry_rate_limit(monkeypatch) -> None:
+    monkeypatch.setattr(quotes_mod, "_COINGECKO_BACKOFF_SECONDS", 0.0)
+    seen: list[int] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        ids = request.url.params["ids"].split(",")
+        assert request.url.params["per_page"] == "250"
+        seen.append(len(ids))
+        if len(seen) == 1:
+            return httpx.Response(429)
+        return httpx.Response(200, json=[{"id": i, "name": i, "current_price": 1.5} for i in ids])
+
+    ids = [f"coin{i}" for i in range(260)]
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await quotes_mod._fetch_coingecko_markets_bulk(client, ids)
+
+    out = asyncio.run(run())
+    assert sorted(out) == sorted(ids)
+    # Two chunks (250 + 10); the first request got a 429 and was retried.
+    assert sorted(seen) == [10, 250, 250]
+
+
+def test_coingecko_bulk_revalidates_with_etag() -> None:
+    conditional: list[str | None] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        conditional.append(request.headers.get("if-none-match"))
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, json=[{"id": "bitcoin", "name": "Bitcoin", "current_price": 1.5}], headers={"ETag": '"v1"'})
+
+    async def run():
+        etags = LRUCache(8)
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            first = await quotes_mod._fetch_coingecko_markets_bulk(client, ["bitcoin"], etags=etags)
+            second = await quotes_mod._fetch_coingecko_markets_bulk(client, ["bitcoin"], etags=etags)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert conditional == [None, '"v1"']
+    assert second == first and second["bitcoin"].price == 1.5
+
+
+def test_quote_cache_survives_restart(monkeypatch, tmp_path) -> None:
+    monkeypatch.setattr(quotes_mod, "QUOTE_CACHE_PATH", tmp_path / "quote_cache.json")
+    calls: list[list[str]] = []
+
+    async def fake_bulk(client, sym_map):
+        calls.append(sorted(sym_map.values()))
+        return {
+            "510300": Quote(code="510300", name="沪深300ETF", price=4.0, change_pct=0.5, as_of=None, source="tencent-qt"),
+            "600519": Quote(code="600519", name="", price=None, change_pct=None, as_of=None, source="tencent-qt"),
+        }
+
+    async def fake_quote(self, code):
+        return Quote(code=code, name="", price=None, change_pct=None, as_of=None, source="unavailable")
+
+    monkeypatch.setattr(quotes_mod, "_fetch_tencent_cn_quotes_bulk", fake_bulk)
+    monkeypatch.setattr(QuoteProvider, "_fetch_quote", fake_quote)
+
+    async def run():
+        first = QuoteProvider()
+        await first.get_quotes_bulk(["510300", "600519"])
+        await first.close()
+
+        second = QuoteProvider()
+        warm = await second.get_quotes_bulk(["510300"])
+        await second.close()
+        return second, warm
+
+    second, warm = asyncio.run(run())
+    # The good quote came back from disk without a request; the error entry was not persisted.
+    assert calls == [["510300", "600519"]]
+    assert warm["510300"].price == 4.0 and warm["510300"].name == "沪深300ETF"
+    assert "600519" not in second._cache
+
+
+def test_daily_nav_quotes_outlive_intraday_estimates(monkeypatch, tmp_path) -> None:
+    monkeypatch.setattr(quotes_mod, "QUOTE_CACHE_PATH", tmp_path / "quote_cache.json")
+
+    async def run():
+        provider = QuoteProvider()
+        await provider.close()
+        return provider
+
+    provider = asyncio.run(run())
+
+    def ttl(source: str) -> float:
+        return provider._ttls_for_quote(Quote(code="018064", name="", price=1.0, change_pct=None, as_of=None, source=source))[0]
+
+    assert ttl("eastmoney-lsjz") == provider.cn_nav_ttl_seconds
+    assert ttl("eastmoney-fundgz") == provider.cn_fund_ttl_seconds
+    assert ttl("tencent-qt") == provider.cn_realtime_ttl_seconds
+    assert ttl("tencent-other") == provider.cn_realtime_ttl_seconds
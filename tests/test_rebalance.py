@@ -1,4 +1,5 @@
 import asyncio
+from dataclasses import asdict
 
 from app.portfolio import Portfolio, PortfolioAsset
 from app.quotes import Quote, QuoteProvider
@@ -47,3 +48,24 @@ def test_rebalance_warns_when_out_of_band() -> None:
     assert view.total_value == 500
     assert len(view.rebalance_warnings) == 1
     assert len(view.warnings) == 1
+
+
+def test_view_to_dict_matches_asdict() -> None:
+    portfolio = Portfolio(
+        categories=Portfolio.default().categories,
+        assets=[
+            PortfolioAsset(kind="cn", code="AAA", name="A", quantity=2, category_id="equity"),
+            PortfolioAsset(kind="cash", name="现金", cash_amount_cny=50.0, category_id="cash"),
+            PortfolioAsset(kind="cn", code="BBB", name="B", quantity=1),
+        ],
+    )
+    quotes = _StubQuotes(
+        {
+            "AAA": Quote(code="AAA", name="A", price=100, change_pct=0.0, as_of="t", source="stub"),
+            "BBB": Quote(code="BBB", name="B", price=None, change_pct=None, as_of=None, source="stub"),
+        }
+    )
+    view = asyncio.run(compute_portfolio_view(portfolio=portfolio, quotes=quotes, chain=_StubChain()))
+    assert view.assets_by_id  # cached properties must not leak into the dump
+    assert view.unassigned and view.warnings
+    assert view.to_dict() == asdict(view)
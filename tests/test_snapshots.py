@@ -0,0 +1,30 @@
+import app.snapshots as snapshots_mod
+from app.rebalance import PortfolioView
+from app.total_history import load_total_history_points
+
+
+def _view(total: float) -> PortfolioView:
+    return PortfolioView(total_value=total, as_of="t", categories=[], unassigned=[], rebalance_warnings=[], warnings=[])
+
+
+def test_unchanged_snapshots_are_skipped_until_heartbeat(tmp_path, monkeypatch) -> None:
+    path = tmp_path / "snapshots.jsonl"
+    monkeypatch.setattr(snapshots_mod, "DATA_DIR", tmp_path)
+    monkeypatch.setattr(snapshots_mod, "SNAPSHOT_PATH", path)
+    monkeypatch.setattr(snapshots_mod, "_last_written", None)
+    clock = [1000.0]
+    monkeypatch.setattr(snapshots_mod.time, "time", lambda: clock[0])
+
+    def append(total: float) -> None:
+        clock[0] += 60
+        snapshots_mod.maybe_append_snapshot(view=_view(total), last_epoch=None)
+
+    append(100.0)
+    append(100.0)  # identical: skipped
+    append(101.0)
+    clock[0] += snapshots_mod.SNAPSHOT_DEDUP_MAX_SECONDS
+    append(101.0)  # identical, but the heartbeat is due
+
+    assert len(path.read_bytes().splitlines()) == 3
+    points = load_total_history_points(path=path, since_seconds=3600, now_epoch=clock[0])
+    assert [p.value for p in points] == [100.0, 101.0, 101.0]
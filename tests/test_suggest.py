@@ -1,4 +1,5 @@
 import asyncio
+from dataclasses import asdict
 
 from app.rebalance_suggest import compute_contribution_suggestion
 
@@ -48,6 +49,7 @@ def test_contribution_suggestion_sums() -> None:
     view = asyncio.run(compute_portfolio_view(portfolio=p, quotes=q, chain=_StubChain()))
     s = compute_contribution_suggestion(view=view, contribution_amount_cny=1000)
     assert round(sum(c.allocate_amount for c in s.categories), 2) == 1000.00
+    assert s.to_dict() == asdict(s)
 
 
 def test_contribution_suggestion_respects_bucket_weights() -> None:
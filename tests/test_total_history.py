@@ -0,0 +1,55 @@
+import json
+
+import app.total_history as total_history_mod
+from app.total_history import append_total_record, build_totals_file, load_total_history_points, totals_path_for
+
+
+def test_binary_totals_match_jsonl_and_slice_window(tmp_path) -> None:
+    path = tmp_path / "snapshots.jsonl"
+    lines = [json.dumps({"ts": 1000.0 + i * 60, "total_value": 100.0 + i}) for i in range(10)]
+    path.write_text("\n".join(lines + ["not json", json.dumps({"ts": 0, "total_value": 1})]) + "\n", encoding="utf-8")
+
+    now = 1000.0 + 9 * 60
+    from_jsonl = load_total_history_points(path=path, since_seconds=300, now_epoch=now)
+
+    build_totals_file(path=path)
+    assert totals_path_for(path).stat().st_size == 10 * 16
+    from_bin = load_total_history_points(path=path, since_seconds=300, now_epoch=now)
+    assert from_bin == from_jsonl
+    assert [p.value for p in from_bin] == [104.0, 105.0, 106.0, 107.0, 108.0, 109.0]
+
+    # A torn trailing record is dropped on the next append instead of misaligning the file.
+    with totals_path_for(path).open("ab") as f:
+        f.write(b"\x00" * 5)
+    append_total_record(path=path, ts=now + 60, value=110.0)
+    points = load_total_history_points(path=path, since_seconds=60, now_epoch=now + 60)
+    assert [(p.ts, p.value) for p in points] == [(now, 109.0), (now + 60, 110.0)]
+
+
+def test_jsonl_tail_streams_backwards_across_chunks(tmp_path, monkeypatch) -> None:
+    path = tmp_path / "snapshots.jsonl"
+    lines = [json.dumps({"ts": 1000.0 + i * 60, "total_value": 100.0 + i, "pad": "x" * (i % 7)}) for i in range(50)]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    now = 1000.0 + 49 * 60
+
+    whole = load_total_history_points(path=path, since_seconds=10 * 60, now_epoch=now)
+    # Chunks smaller than a line: every line straddles a chunk boundary.
+    monkeypatch.setattr(total_history_mod, "_TAIL_CHUNK_BYTES", 16)
+    chunked = load_total_history_points(path=path, since_seconds=10 * 60, now_epoch=now)
+    assert chunked == whole
+    assert [p.value for p in chunked] == [139.0 + i for i in range(11)]
+
+    everything = load_total_history_points(path=path, since_seconds=10**6, now_epoch=now, max_points=0)
+    assert [p.value for p in everything] == [100.0 + i for i in range(50)]
+
+
+def test_binary_downsample_matches_jsonl_downsample(tmp_path) -> None:
+    path = tmp_path / "snapshots.jsonl"
+    path.write_text("".join(json.dumps({"ts": 1000.0 + i * 60, "total_value": float(i)}) + "\n" for i in range(100)))
+    now = 1000.0 + 99 * 60
+
+    from_jsonl = load_total_history_points(path=path, since_seconds=50 * 60, now_epoch=now, max_points=7)
+    build_totals_file(path=path)
+    from_bin = load_total_history_points(path=path, since_seconds=50 * 60, now_epoch=now, max_points=7)
+    assert from_bin == from_jsonl
+    assert [p.value for p in from_bin] == [49.0, 57.0, 65.0, 73.0, 81.0, 89.0, 97.0, 99.0]